@@ -0,0 +1,113 @@
+"""Micro-benchmark of Pipedrive response decoding over synthetic page bodies
+
+Compares `requests.Response.json()` (the previous implementation) with orjson on raw bytes and, if `ijson` is
+installed, the incremental parser used for bodies above JSON_STREAMING_MIN_BYTES. Reports the best time and
+the peak memory allocated while decoding. Run from the repository root:
+
+    python benchmarks/bench_json_decode.py --pages 20 --fields 250
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, List, Tuple
+
+import orjson
+from requests import Response
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_rename_fields import ROWS_PER_PAGE, make_fields_mapping, make_page  # noqa: E402
+
+
+def make_body(page: List[Any], start: int) -> bytes:
+    return orjson.dumps(
+        {
+            "success": True,
+            "data": page,
+            "additional_data": {
+                "pagination": {
+                    "start": start,
+                    "limit": ROWS_PER_PAGE,
+                    "more_items_in_collection": True,
+                    "next_start": start + ROWS_PER_PAGE,
+                }
+            },
+        }
+    )
+
+
+def decode_requests(body: bytes) -> Any:
+    response = Response()
+    response._content = body
+    response.encoding = None
+    return response.json()
+
+
+def decode_orjson(body: bytes) -> Any:
+    return orjson.loads(body)
+
+
+def decode_ijson(body: bytes) -> Any:
+    import ijson
+
+    return dict(ijson.kvitems(io.BytesIO(body), "", use_float=True))
+
+
+def measure(decode: Callable[[bytes], Any], bodies: List[bytes], repeat: int) -> Tuple[float, int]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for body in bodies:
+            decode(body)
+        timings.append(time.perf_counter() - started)
+    # peak of a single page, the body itself is allocated before tracing starts
+    tracemalloc.start()
+    decode(bodies[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--fields", type=int, default=250)
+    parser.add_argument("--fill-ratio", type=float, default=0.3, help="share of custom fields set per row")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fields_mapping = make_fields_mapping(args.fields)
+    bodies = [
+        make_body(make_page(fields_mapping, args.fill_ratio, seed), seed * ROWS_PER_PAGE)
+        for seed in range(args.pages)
+    ]
+
+    decoders = [("requests", decode_requests), ("orjson", decode_orjson)]
+    try:
+        import ijson  # noqa: F401
+
+        decoders.append(("ijson", decode_ijson))
+    except ModuleNotFoundError:
+        print("ijson is not installed, skipping the streaming decoder")
+
+    # all decoders must produce the same page
+    expected = decode_requests(bodies[0])
+    for name, decode in decoders:
+        assert decode(bodies[0]) == expected, name
+
+    megabytes = sum(len(body) for body in bodies) / 1024 / 1024
+    print(f"{args.pages} pages, {megabytes:.1f} MB, {len(bodies[0]) / 1024:.0f} KB per page")
+    for name, decode in decoders:
+        elapsed, peak = measure(decode, bodies, args.repeat)
+        print(
+            f"{name:>8}: {elapsed:.3f}s ({megabytes / elapsed:,.0f} MB/s), "
+            f"peak {peak / 1024 / 1024:.1f} MB per page"
+        )
+
+
+if __name__ == "__main__":
+    main()
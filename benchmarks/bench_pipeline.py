@@ -0,0 +1,164 @@
+"""End-to-end benchmark of `pipedrive_source` against the local Pipedrive stand-in server
+
+Starts `pipedrive_server.py` in a child process, points the source at it with the PIPEDRIVE_API_URL environment
+variable and loads it into duckdb (a temporary file) or the postgres destination configured for dlt. The first
+run is a full load, every following run touches `--changed-ratio` of the rows on the server and loads them
+incrementally. Reports extract, normalize and load time, rows per second, per-resource metrics and the peak
+RSS of the benchmark process. Run from the repository root:
+
+    python benchmarks/bench_pipeline.py --deals 2000 --custom-fields 250 --runs 2
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipedrive_data import TDatasetScale  # noqa: E402
+from pipedrive_server import serve  # noqa: E402
+
+# run without the deals flow, it sends one request per changed deal
+DEFAULT_RESOURCES = "deals,persons,organizations,activities,notes,products,users,stages,leads,custom_fields_mapping"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]  # type: ignore[no-any-return]
+
+
+def peak_rss_mb() -> float:
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_once(pipeline: Any, resources: List[str]) -> Dict[str, Any]:
+    from pipedrive import pipedrive_source
+    from pipedrive.helpers.metrics import metrics_report, reset_timings
+
+    reset_timings()
+    source = pipedrive_source(pipedrive_api_key="bench").with_resources(*resources)
+    timings = {}
+    started = time.perf_counter()
+    pipeline.extract(source)
+    timings["extract"] = time.perf_counter() - started
+    started = time.perf_counter()
+    normalize_info = pipeline.normalize()
+    timings["normalize"] = time.perf_counter() - started
+    started = time.perf_counter()
+    pipeline.load()
+    timings["load"] = time.perf_counter() - started
+    row_counts = {
+        table: count
+        for table, count in normalize_info.row_counts.items()
+        if not table.startswith("_dlt")
+    }
+    return {"timings": timings, "row_counts": row_counts, "metrics": metrics_report()}
+
+
+def print_run(name: str, result: Dict[str, Any]) -> None:
+    timings = result["timings"]
+    total = sum(timings.values())
+    rows = sum(result["row_counts"].values())
+    print(
+        f"{name}: {rows} rows in {total:.1f}s ({rows / total if total else 0:,.0f} rows/s), "
+        + ", ".join(f"{stage} {elapsed:.1f}s" for stage, elapsed in timings.items())
+        + f", peak rss {peak_rss_mb():.0f} MB"
+    )
+    totals = result["metrics"]["totals"]
+    print(
+        f"  requests {totals['requests']} ({totals['throttle_retries']} retried after 429), "
+        f"throttled {totals['throttle_seconds']:.1f}s, http {totals['http_seconds']:.1f}s, "
+        f"decode {totals['decode_seconds']:.1f}s, transform {totals['transform_seconds']:.1f}s, "
+        f"{totals['bytes'] / 1024 / 1024:.1f} MB, {totals['dropped_rows']} rows dropped, "
+        f"{totals['cache_hits']} cache hits, {totals['not_modified']} not modified, "
+        f"{totals['deferred_requests']} requests deferred"
+    )
+    for metrics in result["metrics"]["resources"]:
+        print(
+            f"    {metrics['resource']:>22}: {metrics.get('elapsed', 0.0):.2f}s, "
+            f"{metrics.get('rows', 0)} rows, {metrics.get('pages', 0)} pages, "
+            f"http {metrics.get('http_seconds', 0.0):.2f}s, decode {metrics.get('decode_seconds', 0.0):.2f}s, "
+            f"transform {metrics.get('transform_seconds', 0.0):.2f}s"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--deals", type=int, default=2000)
+    parser.add_argument("--custom-fields", type=int, default=250)
+    parser.add_argument("--fill-ratio", type=float, default=0.3, help="share of custom fields set per row")
+    parser.add_argument("--runs", type=int, default=2, help="first run loads everything, next ones are incremental")
+    parser.add_argument("--changed-ratio", type=float, default=0.01, help="share of rows changed before each incremental run")
+    parser.add_argument("--resources", default=DEFAULT_RESOURCES, help="comma separated resources to load")
+    parser.add_argument("--destination", choices=["duckdb", "postgres"], default="duckdb")
+    parser.add_argument("--rate-limit", type=int, default=80, help="server requests per 2 second window, 0 disables")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the server adds to every request")
+    parser.add_argument("--response-cache", action="store_true", help="cache metadata responses across runs")
+    parser.add_argument("--memory-limit", type=float, help="streaming memory limit of held response bodies in MB")
+    args = parser.parse_args()
+
+    scale = TDatasetScale(deals=args.deals, custom_fields=args.custom_fields, fill_ratio=args.fill_ratio)
+    port = free_port()
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=serve,
+        args=(port, scale),
+        kwargs={"rate_limit": args.rate_limit, "latency": args.latency, "ready": ready},
+        daemon=True,
+    )
+    server.start()
+    if not ready.wait(timeout=600):
+        raise RuntimeError("stand-in server did not start")
+    base_url = f"http://127.0.0.1:{port}"
+    # must be set before the source is imported
+    os.environ["PIPEDRIVE_API_URL"] = base_url
+    os.environ.setdefault("RUNTIME__DLTHUB_TELEMETRY", "false")
+    os.environ.setdefault("RUNTIME__LOG_LEVEL", "ERROR")
+
+    import dlt
+
+    print(f"dataset {scale.counts}, {args.custom_fields} custom fields, destination {args.destination}")
+    with tempfile.TemporaryDirectory() as working_dir:
+        if args.destination == "duckdb":
+            destination: Any = dlt.destinations.duckdb(os.path.join(working_dir, "bench.duckdb"))
+        else:
+            destination = "postgres"
+        pipeline = dlt.pipeline(
+            pipeline_name="pipedrive_bench",
+            destination=destination,
+            dataset_name=f"pipedrive_bench_{int(time.time())}",
+            pipelines_dir=os.path.join(working_dir, "pipelines"),
+        )
+        if args.response_cache:
+            from pipedrive.helpers import response_cache
+
+            response_cache.RESPONSE_CACHE_PATH = os.path.join(working_dir, "responses.sqlite")
+        if args.memory_limit is not None:
+            from pipedrive.helpers.memory_budget import streaming_budget
+
+            streaming_budget.limit = int(args.memory_limit * 1024 * 1024)
+        resources = args.resources.split(",")
+        try:
+            for run in range(args.runs):
+                if run:
+                    request = urllib.request.Request(
+                        f"{base_url}/_bench/touch?ratio={args.changed_ratio}", method="POST"
+                    )
+                    urllib.request.urlopen(request).read()
+                print_run("full load" if run == 0 else f"incremental {run}", run_once(pipeline, resources))
+        finally:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Micro-benchmark of custom fields rename over synthetic pages
+
+Compares the per-row loop over the whole fields mapping (the previous implementation) with the compiled,
+key-driven `rename_fields`. Run from the repository root:
+
+    python benchmarks/bench_rename_fields.py --pages 20 --fields 250
+"""
+
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipedrive.helpers.custom_fields_munger import (  # noqa: E402
+    _coerce_to_list,
+    compile_fields_mapping,
+    rename_fields,
+)
+
+ROWS_PER_PAGE = 500
+
+
+def make_fields_mapping(fields_count: int, seed: int = 0) -> Dict[str, Any]:
+    rnd = random.Random(seed)
+    fields_mapping = {}
+    for i in range(fields_count):
+        field_type = rnd.choice(["varchar", "double", "enum", "set", "date"])
+        options = (
+            {str(o): f"option {o}" for o in range(1, 11)}
+            if field_type in {"enum", "set"}
+            else {}
+        )
+        fields_mapping[f"{i:040x}"] = dict(
+            name=f"custom field {i}",
+            normalized_name=f"custom_field_{i}",
+            options=options,
+            field_type=field_type,
+        )
+    return fields_mapping
+
+
+def make_page(
+    fields_mapping: Dict[str, Any], fill_ratio: float, seed: int = 0
+) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    page = []
+    for row_id in range(ROWS_PER_PAGE):
+        row: Dict[str, Any] = {
+            "id": row_id,
+            "title": f"deal {row_id}",
+            "update_time": "2024-01-01 00:00:00",
+            "org_id": {"value": row_id, "name": "org"},
+        }
+        for hash_string, field in fields_mapping.items():
+            if rnd.random() > fill_ratio:
+                # Pipedrive returns all custom field keys, unset ones are null
+                row[hash_string] = None
+            elif field["field_type"] == "enum":
+                row[hash_string] = str(rnd.randint(1, 10))
+            elif field["field_type"] == "set":
+                row[hash_string] = ",".join(
+                    str(o) for o in rnd.sample(range(1, 11), rnd.randint(1, 3))
+                )
+            else:
+                row[hash_string] = f"value {rnd.random()}"
+        page.append(row)
+    return page
+
+
+def legacy_rename_fields(data: List[Dict[str, Any]], fields_mapping: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The implementation before mappings were compiled, kept here as the baseline"""
+    if not fields_mapping:
+        return data
+    for data_item in data:
+        for hash_string, field in fields_mapping.items():
+            if hash_string not in data_item:
+                continue
+            field_value = data_item.pop(hash_string)
+            field_name = field["name"]
+            options_map = field.get("options") or {}
+            if field_value and field["field_type"] == "set":
+                mapped = []
+                for enum_id in _coerce_to_list(field_value):
+                    mapped_label = options_map.get(str(enum_id))
+                    mapped.append(mapped_label if mapped_label is not None else enum_id)
+                field_value = mapped
+            elif field_value and field["field_type"] == "enum":
+                if isinstance(field_value, (list, tuple)) and len(field_value) == 1:
+                    fv = field_value[0]
+                else:
+                    fv = field_value
+                field_value = options_map.get(str(fv), fv)
+            data_item[field_name] = field_value
+    return data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--fields", type=int, default=250)
+    parser.add_argument("--fill-ratio", type=float, default=0.3, help="share of custom fields set per row")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fields_mapping = make_fields_mapping(args.fields)
+    pages = [make_page(fields_mapping, args.fill_ratio, seed) for seed in range(args.pages)]
+
+    # both implementations must produce the same rows
+    assert legacy_rename_fields(copy.deepcopy(pages[0]), fields_mapping) == rename_fields(
+        copy.deepcopy(pages[0]), fields_mapping
+    )
+
+    def _run_legacy(pages: List[List[Dict[str, Any]]]) -> None:
+        for page in pages:
+            legacy_rename_fields(page, fields_mapping)
+
+    def _run_compiled(pages: List[List[Dict[str, Any]]]) -> None:
+        compiled = compile_fields_mapping(fields_mapping)
+        for page in pages:
+            rename_fields(page, compiled)
+
+    rows = args.pages * ROWS_PER_PAGE
+    for name, run in (("legacy", _run_legacy), ("compiled", _run_compiled)):
+        timings = []
+        for _ in range(args.repeat):
+            # rename mutates rows so every run gets fresh pages, copying is not timed
+            fresh_pages = copy.deepcopy(pages)
+            started = time.perf_counter()
+            run(fresh_pages)
+            timings.append(time.perf_counter() - started)
+        elapsed = min(timings)
+        print(f"{name:>8}: {elapsed:.3f}s for {rows} rows x {args.fields} custom fields ({rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
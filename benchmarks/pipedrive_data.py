@@ -0,0 +1,227 @@
+"""Synthetic Pipedrive dataset used by the stand-in server of the pipeline benchmark
+
+Rows have the shape of v1 api rows: related objects are nested, custom fields are keyed by 40 character
+hashes described by the `*Fields` endpoints, leads use ISO timestamps. Everything is derived from `seed`, so
+two datasets of the same scale are equal.
+"""
+
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple
+
+# first update_time of every entity, rows are updated one `UPDATE_STEP` after another
+BASE_TIME = datetime(2024, 1, 1)
+UPDATE_STEP = timedelta(seconds=7)
+# entities with a fields endpoint, their fields endpoint and the share of the custom fields count they get
+FIELDS_ENTITIES = {
+    "deals": ("dealFields", 1.0),
+    "persons": ("personFields", 0.5),
+    "organizations": ("organizationFields", 0.5),
+    "products": ("productFields", 0.1),
+    "activities": ("activityFields", 0.0),
+}
+CUSTOM_FIELD_TYPES = ["varchar", "double", "enum", "set", "date"]
+OPTIONS_PER_FIELD = 10
+
+
+class TDatasetScale(NamedTuple):
+    deals: int = 2000
+    custom_fields: int = 250
+    # share of custom fields set on every row, Pipedrive returns unset ones as null
+    fill_ratio: float = 0.3
+    deal_flow_items: int = 4
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return {
+            "deals": self.deals,
+            "persons": self.deals,
+            "organizations": max(1, self.deals // 4),
+            "activities": self.deals * 2,
+            "notes": self.deals // 2,
+            "leads": self.deals // 2,
+            "products": min(self.deals, 200),
+            "users": 20,
+            "stages": 12,
+            "pipelines": 2,
+        }
+
+
+def format_time(index: int) -> str:
+    return (BASE_TIME + UPDATE_STEP * index).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def make_fields(scale: TDatasetScale, seed: int = 0) -> Dict[str, List[Dict[str, Any]]]:
+    """Rows of every `*Fields` endpoint: a few built-in fields followed by the custom fields"""
+    rnd = random.Random(seed)
+    fields: Dict[str, List[Dict[str, Any]]] = {}
+    for entity, (fields_entity, share) in FIELDS_ENTITIES.items():
+        rows: List[Dict[str, Any]] = [
+            {"key": "id", "name": "ID", "field_type": "int", "edit_flag": False},
+            {"key": "update_time", "name": "Update time", "field_type": "date", "edit_flag": False},
+            {
+                "key": "status",
+                "name": "Status",
+                "field_type": "enum",
+                "edit_flag": False,
+                "options": [{"id": "open", "label": "Open"}, {"id": "won", "label": "Won"}],
+            },
+        ]
+        for i in range(int(scale.custom_fields * share)):
+            field_type = rnd.choice(CUSTOM_FIELD_TYPES)
+            field: Dict[str, Any] = {
+                "key": f"{rnd.getrandbits(160):040x}",
+                "name": f"{entity} custom field {i}",
+                "field_type": field_type,
+                "edit_flag": True,
+            }
+            if field_type in {"enum", "set"}:
+                field["options"] = [
+                    {"id": option_id, "label": f"option {option_id}"}
+                    for option_id in range(1, OPTIONS_PER_FIELD + 1)
+                ]
+            rows.append(field)
+        fields[fields_entity] = rows
+    return fields
+
+
+def make_rows(
+    scale: TDatasetScale, fields: Dict[str, List[Dict[str, Any]]], seed: int = 0
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Rows of every entity in id order, `update_time` grows with the id"""
+    rnd = random.Random(seed)
+    counts = scale.counts
+    custom_fields = {
+        entity: [field for field in fields[fields_entity] if field["edit_flag"]]
+        for entity, (fields_entity, _) in FIELDS_ENTITIES.items()
+    }
+    rows: Dict[str, List[Dict[str, Any]]] = {}
+    for entity, count in counts.items():
+        entity_rows = []
+        for i in range(count):
+            row = _make_row(entity, i + 1, counts, rnd)
+            for field in custom_fields.get(entity, ()):
+                row[field["key"]] = (
+                    _custom_value(field["field_type"], rnd)
+                    if rnd.random() < scale.fill_ratio
+                    else None
+                )
+            entity_rows.append(row)
+        rows[entity] = entity_rows
+    return rows
+
+
+def make_deal_flow(deal_id: int, update_time: str, items: int) -> List[Dict[str, Any]]:
+    """Flow of a deal: field changes, activities and notes"""
+    flow = []
+    for i in range(items):
+        item_id = deal_id * 100 + i
+        if i % 3 == 0:
+            flow.append(
+                {
+                    "object": "activity",
+                    "timestamp": update_time,
+                    "data": {"id": item_id, "deal_id": deal_id, "subject": f"call {i}", "done": True},
+                }
+            )
+        elif i % 3 == 1:
+            flow.append(
+                {
+                    "object": "note",
+                    "timestamp": update_time,
+                    "data": {"id": item_id, "deal_id": deal_id, "content": f"note {i} of deal {deal_id}"},
+                }
+            )
+        else:
+            flow.append(
+                {
+                    "object": "dealChange",
+                    "timestamp": update_time,
+                    "data": {
+                        "id": item_id,
+                        "item_id": deal_id,
+                        "field_key": "stage_id",
+                        "old_value": str(i),
+                        "new_value": str(i + 1),
+                        "log_time": update_time,
+                    },
+                }
+            )
+    return flow
+
+
+def _make_row(entity: str, row_id: int, counts: Dict[str, int], rnd: random.Random) -> Dict[str, Any]:
+    update_time = format_time(row_id)
+    org_id = rnd.randint(1, counts["organizations"])
+    person_id = rnd.randint(1, counts["persons"])
+    user = {"id": rnd.randint(1, counts["users"]), "name": "Owner", "email": "owner@example.com"}
+    common = {"id": row_id, "add_time": format_time(0), "update_time": update_time}
+    if entity == "deals":
+        return dict(
+            common,
+            title=f"deal {row_id}",
+            value=round(rnd.uniform(100, 100000), 2),
+            currency="EUR",
+            status=rnd.choice(["open", "won", "lost"]),
+            stage_id=rnd.randint(1, counts["stages"]),
+            pipeline_id=rnd.randint(1, counts["pipelines"]),
+            user_id=user,
+            person_id={"value": person_id, "name": f"person {person_id}"},
+            org_id={"value": org_id, "name": f"organization {org_id}"},
+        )
+    if entity == "persons":
+        return dict(
+            common,
+            name=f"person {row_id}",
+            email=[{"label": "work", "value": f"person{row_id}@example.com", "primary": True}],
+            phone=[{"label": "work", "value": f"+1555{row_id:07d}", "primary": True}],
+            owner_id=user,
+            org_id={"value": org_id, "name": f"organization {org_id}"},
+        )
+    if entity == "organizations":
+        return dict(common, name=f"organization {row_id}", address=f"{row_id} Main St", owner_id=user)
+    if entity == "activities":
+        return dict(
+            common,
+            subject=f"activity {row_id}",
+            type=rnd.choice(["call", "meeting", "email"]),
+            done=rnd.random() < 0.5,
+            due_date=update_time[:10],
+            deal_id=rnd.randint(1, counts["deals"]),
+            person_id=person_id,
+            org_id=org_id,
+            user_id=user["id"],
+        )
+    if entity == "notes":
+        return dict(common, content=f"note {row_id} " * 20, deal_id=rnd.randint(1, counts["deals"]))
+    if entity == "leads":
+        return {
+            "id": str(uuid.UUID(int=rnd.getrandbits(128))),
+            "title": f"lead {row_id}",
+            "owner_id": user["id"],
+            "person_id": person_id,
+            "organization_id": org_id,
+            "value": {"amount": rnd.randint(100, 10000), "currency": "EUR"},
+            "add_time": format_time(0).replace(" ", "T") + ".000Z",
+            "update_time": update_time.replace(" ", "T") + ".000Z",
+        }
+    if entity == "products":
+        return dict(common, name=f"product {row_id}", code=f"P{row_id:05d}", prices=[{"price": row_id, "currency": "EUR"}])
+    if entity == "stages":
+        return dict(common, name=f"stage {row_id}", pipeline_id=1 + row_id % counts["pipelines"], order_nr=row_id)
+    if entity == "pipelines":
+        return dict(common, name=f"pipeline {row_id}", active=True)
+    return dict(common, name=f"user {row_id}", email=f"user{row_id}@example.com", active_flag=True)
+
+
+def _custom_value(field_type: str, rnd: random.Random) -> Any:
+    if field_type == "enum":
+        return str(rnd.randint(1, OPTIONS_PER_FIELD))
+    if field_type == "set":
+        return ",".join(str(o) for o in rnd.sample(range(1, OPTIONS_PER_FIELD + 1), rnd.randint(1, 3)))
+    if field_type == "double":
+        return round(rnd.uniform(0, 1000), 2)
+    if field_type == "date":
+        return format_time(rnd.randint(0, 100000))[:10]
+    return f"value {rnd.random():.6f}"
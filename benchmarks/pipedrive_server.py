@@ -0,0 +1,273 @@
+"""Local stand-in for the Pipedrive v1 api serving a synthetic dataset
+
+Speaks v1 offset pagination (`start`, `limit`, `additional_data.pagination`), filters by `since_timestamp`,
+sorts leads by `update_time DESC`, serves `*Fields` and `deals/{id}/flow` endpoints and enforces a fixed
+window rate limit reported in `x-ratelimit-*` headers, answering 429 when the window is exhausted. Bodies
+are gzipped when the client accepts it and carry an ETag, matching `If-None-Match` requests get a 304. Rows are encoded once at startup so the server stays cheap next to
+the pipeline under test. `POST /_bench/touch?ratio=0.01` updates a share of the rows, so incremental runs
+have changes to load. Used by `bench_pipeline.py`, can also be run alone:
+
+    python benchmarks/pipedrive_server.py --port 8765 --deals 2000
+"""
+
+import argparse
+import gzip
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipedrive_data import (  # noqa: E402
+    TDatasetScale,
+    format_time,
+    make_deal_flow,
+    make_fields,
+    make_rows,
+)
+
+MAX_LIMIT = 500
+DEAL_FLOW_PATH = re.compile(r"^deals/(\d+)/flow$")
+
+
+class PipedriveStandIn:
+    def __init__(
+        self,
+        scale: TDatasetScale,
+        seed: int = 0,
+        rate_limit: int = 80,
+        rate_window: float = 2.0,
+        latency: float = 0.0,
+    ) -> None:
+        self.scale = scale
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.latency = latency
+        self.requests = 0
+        self.rate_limited = 0
+        self._fields = make_fields(scale, seed)
+        rows = make_rows(scale, self._fields, seed)
+        self._rows: Dict[str, List[bytes]] = {
+            entity: [orjson.dumps(row) for row in entity_rows] for entity, entity_rows in rows.items()
+        }
+        self._update_times: Dict[str, List[str]] = {
+            entity: [row["update_time"] for row in entity_rows] for entity, entity_rows in rows.items()
+        }
+        self._ids: Dict[int, int] = {row["id"]: index for index, row in enumerate(rows["deals"])}
+        self._matches: Dict[Tuple[str, str, bool], List[int]] = {}
+        self._touches = 0
+        # touched rows get update times past every generated row, increasing with every touch
+        self._clock = max(len(entity_rows) for entity_rows in rows.values())
+        self._lock = threading.Lock()
+        self._window_started = time.monotonic()
+        self._window_requests = 0
+
+    def admit(self) -> Tuple[bool, Dict[str, str]]:
+        """Counts a request in the current rate limit window, returns False if it is over the limit"""
+        with self._lock:
+            self.requests += 1
+            if not self.rate_limit:
+                return True, {}
+            now = time.monotonic()
+            if now - self._window_started >= self.rate_window:
+                self._window_started = now
+                self._window_requests = 0
+            self._window_requests += 1
+            remaining = self.rate_limit - self._window_requests
+            reset = self.rate_window - (now - self._window_started)
+            headers = {
+                "x-ratelimit-limit": str(self.rate_limit),
+                "x-ratelimit-remaining": str(max(remaining, 0)),
+                "x-ratelimit-reset": f"{reset:.2f}",
+            }
+            if remaining < 0:
+                self.rate_limited += 1
+                return False, headers
+            return True, headers
+
+    def get(self, path: str, params: Dict[str, str]) -> bytes:
+        start = int(params.get("start", 0))
+        limit = min(int(params.get("limit", 100)), MAX_LIMIT)
+        match = DEAL_FLOW_PATH.match(path)
+        if match:
+            deal_index = self._ids.get(int(match.group(1)))
+            if deal_index is None:
+                return _page([], start, limit, False)
+            flow = make_deal_flow(
+                int(match.group(1)), self._update_times["deals"][deal_index], self.scale.deal_flow_items
+            )
+            return _page(
+                [orjson.dumps(item) for item in flow[start : start + limit]],
+                start,
+                limit,
+                start + limit < len(flow),
+            )
+        if path in self._fields:
+            fields = self._fields[path]
+            return _page(
+                [orjson.dumps(field) for field in fields[start : start + limit]],
+                start,
+                limit,
+                start + limit < len(fields),
+            )
+        if path not in self._rows:
+            return _page([], start, limit, False)
+        indices = self._matching(path, params.get("since_timestamp"), params.get("sort") == "update_time DESC")
+        rows = self._rows[path]
+        window = [rows[index] for index in indices[start : start + limit]]
+        return _page(window, start, limit, start + limit < len(indices))
+
+    def touch(self, ratio: float, seed: int = 1) -> int:
+        """Updates the title and `update_time` of a share of the deals, persons and organizations"""
+        rnd = random.Random(seed)
+        touched = 0
+        with self._lock:
+            self._touches += 1
+            for entity in ("deals", "persons", "organizations"):
+                rows = self._rows[entity]
+                times = self._update_times[entity]
+                for index in rnd.sample(range(len(rows)), int(len(rows) * ratio)):
+                    row = orjson.loads(rows[index])
+                    self._clock += 1
+                    row["update_time"] = format_time(self._clock)
+                    row["title" if entity == "deals" else "name"] = f"{entity} {row['id']} v{self._touches}"
+                    rows[index] = orjson.dumps(row)
+                    times[index] = row["update_time"]
+                    touched += 1
+            self._matches.clear()
+        return touched
+
+    def _matching(self, entity: str, since: Optional[str], descending: bool) -> List[int]:
+        key = (entity, since or "", descending)
+        with self._lock:
+            indices = self._matches.get(key)
+            if indices is None:
+                times = self._update_times[entity]
+                if entity == "leads":
+                    # leads have iso timestamps and no update filter
+                    indices = list(range(len(times)))
+                else:
+                    indices = [index for index, update_time in enumerate(times) if not since or update_time >= since]
+                if descending:
+                    indices.sort(key=times.__getitem__, reverse=True)
+                self._matches[key] = indices
+            return indices
+
+
+def _page(rows: List[bytes], start: int, limit: int, more_items: bool) -> bytes:
+    pagination = {
+        "start": start,
+        "limit": limit,
+        "more_items_in_collection": more_items,
+        "next_start": start + limit,
+    }
+    data = b"[" + b",".join(rows) + b"]" if rows else b"null"
+    return (
+        b'{"success":true,"data":'
+        + data
+        + b',"additional_data":{"pagination":'
+        + orjson.dumps(pagination)
+        + b"}}"
+    )
+
+
+class PipedriveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes, with Nagle the body waits ~40ms for the client's delayed ACK
+    disable_nagle_algorithm = True
+    server: "PipedriveServer"
+
+    def do_GET(self) -> None:
+        standin = self.server.standin
+        if standin.latency:
+            time.sleep(standin.latency)
+        admitted, headers = standin.admit()
+        if not admitted:
+            self._send(429, b'{"success":false,"error":"Request over limit"}', headers)
+            return
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if not url.path.startswith("/v1/"):
+            self._send(404, b'{"success":false,"error":"Unknown path"}', headers)
+            return
+        body = standin.get(url.path[len("/v1/") :], params)
+        etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        headers = dict(headers, ETag=etag)
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", headers)
+            return
+        self._send(200, body, headers)
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path != "/_bench/touch":
+            self._send(404, b"{}", {})
+            return
+        ratio = float(parse_qs(url.query).get("ratio", ["0.01"])[-1])
+        touched = self.server.standin.touch(ratio)
+        self._send(200, orjson.dumps({"touched": touched}), {})
+
+    def _send(self, status: int, body: bytes, headers: Dict[str, str]) -> None:
+        if body and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            headers = dict(headers, **{"Content-Encoding": "gzip"})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class PipedriveServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, standin: PipedriveStandIn) -> None:
+        super().__init__(("127.0.0.1", port), PipedriveHandler)
+        self.standin = standin
+
+
+def serve(
+    port: int,
+    scale: TDatasetScale,
+    seed: int = 0,
+    rate_limit: int = 80,
+    latency: float = 0.0,
+    ready: Any = None,
+) -> None:
+    """Builds the dataset and serves it until the process is terminated, sets `ready` once listening"""
+    server = PipedriveServer(port, PipedriveStandIn(scale, seed, rate_limit, latency=latency))
+    if ready is not None:
+        ready.set()
+    server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--deals", type=int, default=2000)
+    parser.add_argument("--custom-fields", type=int, default=250)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate-limit", type=int, default=80, help="requests per 2 second window, 0 disables")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args()
+    scale = TDatasetScale(deals=args.deals, custom_fields=args.custom_fields)
+    print(f"serving {scale.counts} on http://127.0.0.1:{args.port}")
+    serve(args.port, scale, args.seed, args.rate_limit, args.latency)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,24 +9,51 @@ Api changelog: https://developers.pipedrive.com/changelog
 To get an api key: https://pipedrive.readme.io/docs/how-to-find-the-api-token
 """
 
-from typing import Any, Dict, Iterator, List, Optional, Union, Iterator
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple, Union, Iterator
 
 import dlt
 
-from .helpers.custom_fields_munger import update_fields_mapping, rename_fields
-from .helpers.pages import get_recent_items_incremental, get_pages
-from .helpers import group_deal_flows
-from .typing import TDataPage
-from .settings import ENTITY_MAPPINGS, RECENTS_ENTITIES
+from .helpers.custom_fields_munger import (
+    CompiledFieldsMapping,
+    compile_fields_mapping,
+    rename_fields,
+)
+from .helpers.pages import (
+    FIELDS_ENTITIES,
+    commit_cursor,
+    get_recent_items_incremental,
+    get_pages,
+    refresh_fields_mapping,
+)
+from .helpers import TableBatches, group_deal_flows
+from .helpers.memory_budget import MemoryCharge, streaming_budget
+from .helpers.metrics import add_metrics, measure, resource_metrics
+from .typing import TDataPage, TPaginationCheckpoint
+from .settings import (
+    ARROW_CURSOR_COLUMN,
+    ARROW_ENTITIES,
+    DEALS_FLOW_BATCH_ROWS,
+    DEALS_FLOW_CONCURRENCY,
+    ENTITY_MAPPINGS,
+    FULL_REFRESH_END_VALUE,
+    FULL_REFRESH_INTERVAL,
+    PARALLEL_EXTRACTION,
+    RECENTS_ENTITIES,
+)
 from dlt.common import pendulum
+from dlt.common.schema.typing import TWriteDisposition
 from dlt.common.time import ensure_pendulum_datetime
 from dlt.sources import DltResource, TDataItems
 
 
-@dlt.source(name="pipedrive")
+@dlt.source(name="pipedrive", root_key=True)
 def pipedrive_source(
     pipedrive_api_key: str = dlt.secrets.value,
     since_timestamp: Optional[Union[pendulum.DateTime, str]] = "1970-01-01 00:00:00",
+    full_refresh: Optional[bool] = None,
 ) -> Iterator[DltResource]:
     """
     Get data from the Pipedrive API. Supports incremental loading and custom fields mapping.
@@ -34,6 +61,8 @@ def pipedrive_source(
     Args:
         pipedrive_api_key: https://pipedrive.readme.io/docs/how-to-find-the-api-token
         since_timestamp: Starting timestamp for incremental loading. By default complete history is loaded on first run.
+        full_refresh: Reload and replace all tables to pick up deleted records instead of merging changed records.
+            By default a full refresh happens every FULL_REFRESH_INTERVAL seconds.
 
     Returns resources:
         custom_fields_mapping
@@ -60,6 +89,9 @@ def pipedrive_source(
     Resources that depend on another resource are implemented as transformers
     so they can re-use the original resource data without re-downloading.
     Examples:  deals_participants, deals_flow
+
+    Incremental runs merge changed records on `id`, full refreshes reload from `since_timestamp`
+    and replace the tables.
     """
 
     # yield nice rename mapping
@@ -73,15 +105,54 @@ def pipedrive_source(
         {"since_timestamp": since_timestamp} if since_timestamp else {}
     )
 
+    if "deal" in ARROW_ENTITIES:
+        # the deals_flow transformer reads the ids and update times of deal rows
+        raise ValueError("deal cannot be in ARROW_ENTITIES, deals_flow needs deal rows as dicts")
+
+    # merge changed records or reload everything
+    state = dlt.current.source_state()
+    if full_refresh is None:
+        full_refresh = _is_full_refresh_due(state)
+    write_disposition: TWriteDisposition = "merge"
+    if full_refresh:
+        write_disposition = "replace"
+
     # create resources for all endpoints
     endpoints_resources = {}
     for entity, resource_name in RECENTS_ENTITIES.items():
+        columns: Any = None
+        entity_kwargs = dict(resource_kwargs, full_refresh=full_refresh)
+        entity_write_disposition = write_disposition
+        cursor_path = "update_time|modified"
+        if entity in ARROW_ENTITIES:
+            # arrow tables are filtered on a single text cursor column, declared as timestamp
+            columns = {ARROW_CURSOR_COLUMN: {"data_type": "timestamp"}}
+            cursor_path = ARROW_CURSOR_COLUMN
+        checkpoint: Optional[TPaginationCheckpoint] = state.get(
+            "pagination_checkpoints", {}
+        ).get(resource_name)
+        if checkpoint:
+            # resume an interrupted pagination with its initial cursor, the pages it loaded are kept
+            entity_write_disposition = "merge"
+            entity_kwargs.update(
+                full_refresh=checkpoint["full_refresh"],
+                start=checkpoint["next_start"],
+                since_timestamp=_since_incremental(
+                    cursor_path, checkpoint["since_timestamp"], True
+                ),
+            )
+        elif entity in ARROW_ENTITIES or full_refresh:
+            entity_kwargs["since_timestamp"] = _since_incremental(
+                cursor_path, since_timestamp, full_refresh
+            )
         endpoints_resources[resource_name] = dlt.resource(
             get_recent_items_incremental,
             name=resource_name,
             primary_key="id",
-            write_disposition="replace",
-        )(entity, resource_name, pipedrive_api_key, **resource_kwargs)
+            write_disposition=entity_write_disposition,
+            parallelized=PARALLEL_EXTRACTION,
+            columns=columns,
+        )(entity, resource_name, pipedrive_api_key, **entity_kwargs)
 
     yield from endpoints_resources.values()
 
@@ -91,25 +162,143 @@ def pipedrive_source(
     # )(_get_deals_participants)(pipedrive_api_key)
 
     yield endpoints_resources["deals"] | dlt.transformer(
-        name="deals_flow", write_disposition="replace", primary_key="id"
-    )(_get_deals_flow)(pipedrive_api_key)
+        name="deals_flow",
+        write_disposition=write_disposition,
+        primary_key="id",
+        parallelized=PARALLEL_EXTRACTION,
+    )(_get_deals_flow)(pipedrive_api_key, full_refresh, state.get("last_full_refresh"))
 
     # if simple value is passed in place of incremental, it will be used as initial value
-    yield leads(pipedrive_api_key, update_time=since_timestamp)  # type: ignore[arg-type]
+    leads_update_time: Any = (
+        _since_incremental("update_time", since_timestamp, full_refresh)
+        if full_refresh
+        else since_timestamp
+    )
+    yield leads(pipedrive_api_key, update_time=leads_update_time).apply_hints(
+        write_disposition=write_disposition
+    )
+
+
+def _since_incremental(
+    cursor_path: str, since_timestamp: str, full_refresh: bool
+) -> dlt.sources.incremental[str]:
+    """Incremental starting at `since_timestamp`. Full refreshes and resumed paginations have an end value,
+    so the stored cursor is ignored and kept for the following incremental runs.
+    """
+    return dlt.sources.incremental(
+        cursor_path,
+        initial_value=since_timestamp,
+        end_value=FULL_REFRESH_END_VALUE if full_refresh else None,
+    )
+
+
+def _is_full_refresh_due(state: Dict[str, Any]) -> bool:
+    if FULL_REFRESH_INTERVAL is None:
+        return "last_full_refresh" not in state
+    last_full_refresh = state.get("last_full_refresh")
+    return (
+        last_full_refresh is None
+        or pendulum.now().timestamp() - last_full_refresh >= FULL_REFRESH_INTERVAL
+    )
+
+
+# guards the rebuild of `deals_flow_update_times` against deals pages transformed in parallel
+_flow_update_times_lock = Lock()
 
 
 def _get_deals_flow(
-    deals_page: TDataPage, pipedrive_api_key: str
+    deals_page: TDataPage,
+    pipedrive_api_key: str,
+    full_refresh: bool = False,
+    last_full_refresh: Optional[float] = None,
 ) -> Iterator[TDataItems]:
-    custom_fields_mapping = dlt.current.source_state().get("custom_fields_mapping", {})
-    for row in deals_page:
-        url = f"deals/{row['id']}/flow"
-        pages = get_pages(url, pipedrive_api_key)
-        for entity, page in group_deal_flows(pages):
-            yield dlt.mark.with_table_name(
-                rename_fields(page, custom_fields_mapping.get(entity, {})),
-                "deals_flow_" + entity,
+    """Loads flows of deals whose `update_time` changed since the flow was last loaded.
+    Full refreshes load flows of all deals and rebuild the update times kept in state from the deals they
+    see, so deleted deals are dropped. `last_full_refresh` identifies the full refresh, a resumed one keeps
+    the update times it rebuilt so far.
+
+    Flows are fetched concurrently, their rows are yielded in batches per table across deals. Flows are
+    charged to the streaming memory budget until their rows are batched, no flow is requested ahead while
+    the budget is exhausted.
+    """
+    state = dlt.current.source_state()
+    with _flow_update_times_lock:
+        if full_refresh and (
+            "deals_flow_rebuilt_after" not in state
+            or state["deals_flow_rebuilt_after"] != last_full_refresh
+        ):
+            state["deals_flow_update_times"] = {}
+            state["deals_flow_rebuilt_after"] = last_full_refresh
+        flow_update_times: Dict[str, str] = state.setdefault("deals_flow_update_times", {})
+    changed_deals = [
+        row
+        for row in deals_page
+        if full_refresh or flow_update_times.get(str(row["id"])) != row.get("update_time")
+    ]
+    if not changed_deals:
+        return
+
+    # mappings are compiled for the flow entities seen, each waits until `create_state` refreshed it
+    compiled_mappings: Dict[str, CompiledFieldsMapping] = {}
+
+    def _fields_mapping(entity: str) -> CompiledFieldsMapping:
+        if entity not in compiled_mappings:
+            compiled_mappings[entity] = compile_fields_mapping(
+                refresh_fields_mapping(entity, pipedrive_api_key)
+                if entity in FIELDS_ENTITIES
+                else {}
             )
+        return compiled_mappings[entity]
+
+    metrics = resource_metrics("deals_flow")
+
+    def _fetch_deal_flow(deal_id: int, charge: MemoryCharge) -> List[TDataPage]:
+        return list(
+            get_pages(
+                f"deals/{deal_id}/flow", pipedrive_api_key, metrics=metrics, charge=charge
+            )
+        )
+
+    def _flush(entity: str, batch: TDataPage) -> Any:
+        with measure(metrics, "transform_seconds"):
+            batch = rename_fields(batch, _fields_mapping(entity))
+        add_metrics(metrics, rows=len(batch), pages=1)
+        return dlt.mark.with_table_name(batch, "deals_flow_" + entity)
+
+    batches = TableBatches(DEALS_FLOW_BATCH_ROWS)
+    deals = iter(changed_deals)
+    flows: Deque[Tuple[TDataPage, "Future[List[TDataPage]]", MemoryCharge]] = deque()
+    executor = ThreadPoolExecutor(max_workers=DEALS_FLOW_CONCURRENCY)
+
+    def _submit_flows() -> None:
+        while len(flows) < DEALS_FLOW_CONCURRENCY:
+            if flows and streaming_budget.exhausted:
+                add_metrics(metrics, deferred_requests=1)
+                return
+            row = next(deals, None)
+            if row is None:
+                return
+            charge = MemoryCharge(streaming_budget)
+            flows.append((row, executor.submit(_fetch_deal_flow, row["id"], charge), charge))
+
+    try:
+        _submit_flows()
+        while flows:
+            row, flow, charge = flows[0]
+            for entity, rows in group_deal_flows(flow.result()):
+                for batch_entity, batch in batches.add(entity, rows):
+                    yield _flush(batch_entity, batch)
+            # state is committed with the load package, after the buffered rows are yielded
+            flow_update_times[str(row["id"])] = row.get("update_time")
+            flows.popleft()
+            charge.release()
+            _submit_flows()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for _, _, charge in flows:
+            charge.release()
+    for entity, batch in batches.flush():
+        yield _flush(entity, batch)
 
 
 # def _get_deals_participants(
@@ -120,30 +309,28 @@ def _get_deals_flow(
 #         yield from get_pages(url, pipedrive_api_key)
 
 
-@dlt.resource(selected=False)
+@dlt.resource(selected=False, parallelized=PARALLEL_EXTRACTION)
 def create_state(pipedrive_api_key: str) -> Iterator[Dict[str, Any]]:
-    def _get_pages_for_rename(
-        entity: str, fields_entity: str, pipedrive_api_key: str
-    ) -> Dict[str, Any]:
-        existing_fields_mapping: Dict[
-            str, Dict[str, str]
-        ] = custom_fields_mapping.setdefault(entity, {})
-        # we need to process all pages before yielding
-        for page in get_pages(fields_entity, pipedrive_api_key):
-            existing_fields_mapping = update_fields_mapping(
-                page, existing_fields_mapping
-            )
-        return existing_fields_mapping
+    """Keeps *Fields data in state, endpoints are refetched only when their cached mapping expired.
 
-    # gets all *Fields data and stores in state
-    custom_fields_mapping = dlt.current.source_state().setdefault(
-        "custom_fields_mapping", {}
-    )
-    for entity, fields_entity, _ in ENTITY_MAPPINGS:
-        if fields_entity is None:
-            continue
-        custom_fields_mapping[entity] = _get_pages_for_rename(
-            entity, fields_entity, pipedrive_api_key
+    All *Fields endpoints are fetched concurrently. Data resources do not wait for this resource, each of
+    them waits only for the mapping of its own entity (see `refresh_fields_mapping`).
+    """
+    state = dlt.current.source_state()
+    naming = dlt.current.source_schema().naming
+    custom_fields_mapping = state.setdefault("custom_fields_mapping", {})
+    entities = [
+        entity for entity, fields_entity, _ in ENTITY_MAPPINGS if fields_entity is not None
+    ]
+    with ThreadPoolExecutor(max_workers=len(entities)) as executor:
+        # list() re-raises errors from the workers
+        list(
+            executor.map(
+                lambda entity: refresh_fields_mapping(
+                    entity, pipedrive_api_key, state=state, naming=naming
+                ),
+                entities,
+            )
         )
 
     yield custom_fields_mapping
@@ -174,7 +361,7 @@ def parsed_mapping(
         ]
 
 
-@dlt.resource(primary_key="id", write_disposition="replace")
+@dlt.resource(primary_key="id", write_disposition="merge", parallelized=PARALLEL_EXTRACTION)
 def leads(
     pipedrive_api_key: str = dlt.secrets.value,
     update_time: dlt.sources.incremental[str] = dlt.sources.incremental(
@@ -183,18 +370,37 @@ def leads(
 ) -> Iterator[TDataPage]:
     """Resource to incrementally load pipedrive leads by update_time"""
     # Leads inherit custom fields from deals
-    fields_mapping = (
-        dlt.current.source_state().get("custom_fields_mapping", {}).get("deals", {})
+    fields_mapping = compile_fields_mapping(
+        refresh_fields_mapping("deal", pipedrive_api_key)
     )
-    # Load leads pages sorted from newest to oldest and stop loading when
-    # last incremental value is reached
+    # the leads endpoint has no update filter, pages are sorted from newest to oldest and loading stops at
+    # the first lead older than the cursor. The start value does not move while the resource runs, unlike
+    # `last_value`, so it is safe to read from a worker thread
+    start_value = update_time.start_value
+    max_cursor = None
+    metrics = resource_metrics("leads")
     pages = get_pages(
         "leads",
         pipedrive_api_key,
         extra_params={"sort": "update_time DESC"},
+        metrics=metrics,
     )
     for page in pages:
-        yield rename_fields(page, fields_mapping)
-
-        if update_time.start_out_of_range:
-            return
+        # leads updated at the cursor are kept, dlt deduplicates those it already loaded
+        fresh_leads = [
+            lead
+            for lead in page
+            if start_value is None or (lead.get("update_time") or "") >= start_value
+        ]
+        if fresh_leads:
+            if max_cursor is None:
+                max_cursor = fresh_leads[0].get("update_time")
+            with measure(metrics, "transform_seconds"):
+                fresh_leads = rename_fields(fresh_leads, fields_mapping)
+            add_metrics(metrics, rows=len(fresh_leads), pages=1)
+            yield fresh_leads
+        if len(fresh_leads) < len(page):
+            break
+    # a full refresh keeps no cursor state, the newest lead is the cursor of the next run
+    if update_time.end_value is not None and max_cursor is not None:
+        commit_cursor("leads", update_time, max_cursor)
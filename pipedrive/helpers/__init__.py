@@ -1,20 +1,40 @@
 """Pipedrive source helpers"""
 
-from typing import Any, Iterable, Tuple, Dict, List
-from itertools import groupby
-
-
-def _deals_flow_group_key(item: Dict[str, Any]) -> str:
-    return item["object"]  # type: ignore[no-any-return]
+from typing import Any, Iterable, Iterator, Tuple, Dict, List
 
 
 def group_deal_flows(
     pages: Iterable[Iterable[Dict[str, Any]]]
 ) -> Iterable[Tuple[str, List[Dict[str, Any]]]]:
+    """Groups flow items of every page by object type, in the order the types first appear"""
     for page in pages:
-        for entity, items in groupby(
-            sorted(page, key=_deals_flow_group_key), key=_deals_flow_group_key
-        ):
-            yield entity, [
-                dict(item["data"], timestamp=item["timestamp"]) for item in items
-            ]
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for item in page:
+            rows = groups.get(item["object"])
+            if rows is None:
+                rows = groups[item["object"]] = []
+            rows.append(dict(item["data"], timestamp=item["timestamp"]))
+        yield from groups.items()
+
+
+class TableBatches:
+    """Collects rows per table and releases them in batches of `max_rows` rows"""
+
+    def __init__(self, max_rows: int) -> None:
+        self.max_rows = max_rows
+        self._batches: Dict[str, List[Dict[str, Any]]] = {}
+
+    def add(
+        self, table_name: str, rows: List[Dict[str, Any]]
+    ) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """Buffers `rows`, yields the batch of `table_name` once it is full"""
+        batch = self._batches.setdefault(table_name, [])
+        batch.extend(rows)
+        if len(batch) >= self.max_rows:
+            del self._batches[table_name]
+            yield table_name, batch
+
+    def flush(self) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """Yields all buffered batches"""
+        batches, self._batches = self._batches, {}
+        yield from batches.items()
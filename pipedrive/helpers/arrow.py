@@ -0,0 +1,165 @@
+"""Columnar page transform: converts pages to arrow tables so dlt uses its arrow normalizer
+
+Output matches the dict path for scalar and nested object fields:
+ - nested objects (ie. `org_id`) are flattened into `org_id__value`, `org_id__name` columns like dlt does
+ - custom field hashes are renamed and enum options are mapped through dictionary encoded lookups
+ - columns of fields in the mapping get the arrow type of their Pipedrive field type (ARROW_FIELD_TYPES),
+   so a field has the same type on every page whatever values the page holds
+ - other Pipedrive timestamps (`YYYY-MM-DD HH:MM:SS`) become timestamp columns, as dlt detects them on dicts.
+   The incremental cursor column stays text so it compares with the cursor state, the resource declares it
+   as timestamp instead
+List values (including mapped `set` fields) are kept inline as json columns instead of child tables,
+so enable it only for entities whose child tables are not consumed downstream.
+"""
+
+from typing import Any, Dict, List, Mapping
+
+from dlt.common.exceptions import MissingDependencyException
+
+from .custom_fields_munger import CompiledFieldsMapping
+from ..typing import TDataPage
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ModuleNotFoundError:
+    raise MissingDependencyException("Pipedrive arrow pages", ["pyarrow"])
+
+PIPEDRIVE_TIMESTAMP_REGEX = r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$"
+PIPEDRIVE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# column types of Pipedrive field types, values of `set` fields are lists of option labels. Fields of other
+# types (ie. `user`, `org` or `address` objects) are typed from their values
+ARROW_FIELD_TYPES = {
+    "varchar": pa.string(),
+    "varchar_auto": pa.string(),
+    "text": pa.string(),
+    "phone": pa.string(),
+    "date": pa.string(),
+    "time": pa.string(),
+    "enum": pa.string(),
+    "set": pa.list_(pa.string()),
+    "double": pa.float64(),
+    "monetary": pa.float64(),
+    "int": pa.int64(),
+}
+
+
+def page_to_arrow(
+    page: TDataPage, fields_mapping: CompiledFieldsMapping, cursor_column: str
+) -> pa.Table:
+    """Converts a page of Pipedrive rows into an arrow table with renamed and mapped custom fields"""
+    table = _flatten_structs(_build_table(page), fields_mapping.names)
+    columns: List[pa.ChunkedArray] = []
+    names: List[str] = []
+    for name, column in zip(table.column_names, table.columns):
+        converter = fields_mapping.converters.get(name)
+        if converter is not None:
+            column = _map_options(column, converter)
+        arrow_type = ARROW_FIELD_TYPES.get(fields_mapping.field_types.get(name))  # type: ignore[arg-type]
+        if arrow_type is not None:
+            column = _cast(column, arrow_type)
+        elif name != cursor_column:
+            column = _parse_timestamps(column)
+        columns.append(column)
+        names.append(fields_mapping.names.get(name, name))
+    return pa.Table.from_arrays(columns, names=names)
+
+
+def _build_table(page: TDataPage) -> pa.Table:
+    try:
+        return pa.Table.from_pylist(page)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    # some column has values of mixed types, build the table column by column and fall back to text
+    keys: Dict[str, None] = {}
+    for row in page:
+        keys.update(dict.fromkeys(row))
+    arrays = {}
+    for key in keys:
+        values = [row.get(key) for row in page]
+        try:
+            arrays[key] = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays[key] = pa.array(
+                [None if value is None else str(value) for value in values], pa.string()
+            )
+    return pa.table(arrays)
+
+
+def _flatten_structs(table: pa.Table, names: Mapping[str, str]) -> pa.Table:
+    """Flattens nested objects with dlt's `__` path separator. The custom field hash of an object column is
+    renamed in the flattened names (`<hash>.value` becomes `<name>__value`) like the dict path renames it
+    before dlt flattens, scalar columns keep their hash and are renamed by the caller.
+    """
+    if not any(pa.types.is_struct(field.type) for field in table.schema):
+        return table
+    # pipedrive keys never contain dots
+    while any(pa.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+    flattened_names = []
+    for name in table.column_names:
+        parent, dot, path = name.partition(".")
+        if dot:
+            name = names.get(parent, parent) + "__" + path.replace(".", "__")
+        flattened_names.append(name)
+    return table.rename_columns(flattened_names)
+
+
+def _map_options(column: pa.ChunkedArray, converter: Any) -> pa.ChunkedArray:
+    """Maps option ids to labels. Enum columns are dictionary encoded so each distinct id is mapped once,
+    other layouts (ie. comma separated `set` ids) go through the converter value by value.
+    """
+    if pa.types.is_null(column.type):
+        return column
+    if pa.types.is_string(column.type) or pa.types.is_integer(column.type):
+        encoded = pc.cast(column, pa.string()).combine_chunks().dictionary_encode()
+        labels = [converter(value) if value else value for value in encoded.dictionary.to_pylist()]
+        if all(label is None or isinstance(label, str) for label in labels):
+            return pa.chunked_array(
+                [
+                    pa.DictionaryArray.from_arrays(
+                        encoded.indices, pa.array(labels, pa.string())
+                    ).dictionary_decode()
+                ]
+            )
+    values = [converter(value) if value else value for value in column.to_pylist()]
+    try:
+        return pa.chunked_array([pa.array(values)])
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.chunked_array(
+            [pa.array([None if value is None else str(value) for value in values], pa.string())]
+        )
+
+
+def _cast(column: pa.ChunkedArray, arrow_type: pa.DataType) -> pa.ChunkedArray:
+    if column.type == arrow_type:
+        return column
+    try:
+        return pc.cast(column, arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        pass
+    # values that do not fit the field type (ie. text in a `double` field) are kept as text
+    if pa.types.is_list(arrow_type):
+        arrow_type = pa.list_(pa.string())
+        values = [
+            None if value is None else [str(item) for item in _list_wrapped(value)]
+            for value in column.to_pylist()
+        ]
+    else:
+        arrow_type = pa.string()
+        values = [None if value is None else str(value) for value in column.to_pylist()]
+    return pa.chunked_array([pa.array(values, arrow_type)])
+
+
+def _list_wrapped(value: Any) -> List[Any]:
+    return value if isinstance(value, list) else [value]
+
+
+def _parse_timestamps(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    if not pa.types.is_string(column.type) or column.null_count == len(column):
+        return column
+    matches = pc.match_substring_regex(column, PIPEDRIVE_TIMESTAMP_REGEX)
+    if not pc.all(matches).as_py():
+        return column
+    parsed = pc.strptime(column, format=PIPEDRIVE_TIMESTAMP_FORMAT, unit="us")
+    return pc.cast(parsed, pa.timestamp("us", tz="UTC"))
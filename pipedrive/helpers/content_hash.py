@@ -0,0 +1,117 @@
+"""Extract-side filter of duplicate and unchanged rows
+
+A row whose id was already returned in the run is dropped unless its cursor is newer, within a page only the
+latest version of an id is kept. Across runs, kept rows are loaded with their content hash in a
+CONTENT_HASH_COLUMN column and rows hashing like the version in the destination table are dropped. The hashes
+of the ids in a page are looked up in the destination table when the page is filtered, so they are committed
+with the rows they describe and only the rows returned by the api are read back. The hash skips CONTENT_HASH_EXCLUDED_FIELDS, so rows whose
+`update_time` was bumped without a change of their payload are not loaded again.
+"""
+
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import dlt
+import orjson
+from dlt.common.destination.exceptions import SqlClientNotAvailable
+from dlt.destinations.exceptions import DatabaseUndefinedRelation
+
+from ..settings import CONTENT_HASH_EXCLUDED_FIELDS
+from ..typing import TDataPage
+
+CONTENT_HASH_COLUMN = "_content_hash"
+
+
+def content_hash(row: Dict[str, Any], excluded_fields: Iterable[str] = CONTENT_HASH_EXCLUDED_FIELDS) -> str:
+    """Short hash of the json of `row` without `excluded_fields`, independent of key order"""
+    payload = {key: value for key, value in row.items() if key not in excluded_fields}
+    return hashlib.blake2b(
+        orjson.dumps(payload, option=orjson.OPT_SORT_KEYS), digest_size=8
+    ).hexdigest()
+
+
+def lookup_content_hashes(table_name: str, ids: List[Any]) -> Dict[str, str]:
+    """`id -> content hash` of the rows with `ids` loaded to `table_name` by the running pipeline, empty before
+    the first load with hashes or when the destination cannot be queried with sql
+    """
+    table = dlt.current.source_schema().tables.get(table_name)
+    if not ids or table is None or CONTENT_HASH_COLUMN not in table.get("columns", {}):
+        return {}
+    try:
+        with dlt.current.pipeline().sql_client() as client:
+            rows = client.execute_sql(
+                f"select id, {CONTENT_HASH_COLUMN} from {client.make_qualified_table_name(table_name)} "
+                f"where id in ({', '.join(['%s'] * len(ids))}) and {CONTENT_HASH_COLUMN} is not null",
+                *ids,
+            )
+    except (DatabaseUndefinedRelation, SqlClientNotAvailable):
+        return {}
+    return {str(row_id): row_hash for row_id, row_hash in rows or ()}
+
+
+class ContentHashFilter:
+    """Drops rows of one entity already returned in this run or unchanged since they were last loaded.
+
+    `lookup` returns the loaded `id -> content hash` of the ids passed, it is called once per page with the ids
+    not kept earlier in the run. The hash of every row kept is set on the row under CONTENT_HASH_COLUMN. Without
+    `lookup` only duplicates are dropped, which full refreshes use to rehash all rows.
+    """
+
+    def __init__(
+        self,
+        lookup: Optional[Callable[[List[Any]], Dict[str, str]]],
+        cursor_fields: List[str],
+    ) -> None:
+        self.lookup = lookup
+        self.cursor_fields = cursor_fields
+        # hashes of the rows kept in this run
+        self.index: Dict[str, str] = {}
+        # highest cursor of all rows seen, dropped ones included
+        self.max_cursor: Optional[str] = None
+        self.duplicate_rows = 0
+        self.unchanged_rows = 0
+        self._seen_cursors: Dict[str, Any] = {}
+
+    def filter(self, page: TDataPage) -> TDataPage:
+        latest: Dict[str, Dict[str, Any]] = {}
+        rows: List[Dict[str, Any]] = []
+        for row in page:
+            cursor = self._cursor(row)
+            if cursor is not None and (self.max_cursor is None or cursor > self.max_cursor):
+                self.max_cursor = cursor
+            if row.get("id") is None:
+                rows.append(row)
+                continue
+            row_id = str(row["id"])
+            previous = latest.get(row_id)
+            if previous is None:
+                previous_cursor = self._seen_cursors.get(row_id)
+                if row_id in self._seen_cursors and not _is_newer(cursor, previous_cursor):
+                    self.duplicate_rows += 1
+                    continue
+            else:
+                self.duplicate_rows += 1
+                if not _is_newer(cursor, self._cursor(previous)):
+                    continue
+            latest[row_id] = row
+            self._seen_cursors[row_id] = cursor
+
+        loaded: Dict[str, str] = {}
+        if self.lookup is not None:
+            loaded = self.lookup([row["id"] for row_id, row in latest.items() if row_id not in self.index])
+        for row_id, row in latest.items():
+            row_hash = content_hash(row)
+            if self.lookup is not None and self.index.get(row_id, loaded.get(row_id)) == row_hash:
+                self.unchanged_rows += 1
+                continue
+            self.index[row_id] = row_hash
+            row[CONTENT_HASH_COLUMN] = row_hash
+            rows.append(row)
+        return rows
+
+    def _cursor(self, row: Dict[str, Any]) -> Any:
+        return next((row[field] for field in self.cursor_fields if row.get(field)), None)
+
+
+def _is_newer(cursor: Any, previous_cursor: Any) -> bool:
+    return cursor is not None and (previous_cursor is None or cursor > previous_cursor)
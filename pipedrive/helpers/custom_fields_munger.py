@@ -1,10 +1,33 @@
-from typing import Any, Dict, TypedDict, Optional
+import hashlib
+import re
+from functools import lru_cache
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    TypedDict,
+    Union,
+)
 
 import dlt
+from dlt.common import json
+from dlt.common.normalizers.naming import NamingConvention
 
 from ..typing import TDataPage
 
 
+# custom field keys are 40 chars long hex hashes, sub-fields (ie. `<hash>_currency`) are not matched
+CUSTOM_FIELD_HASH_REGEX = re.compile(r"^[0-9a-f]{40}$")
+
+
 class TFieldMapping(TypedDict):
     name: str
     normalized_name: str
@@ -12,12 +35,68 @@ class TFieldMapping(TypedDict):
     field_type: str
 
 
+class TFieldsMappingRefresh(TypedDict):
+    fingerprint: str
+    fetched_at: float
+
+
+def fields_fingerprint(fields_pages: Iterable[TDataPage]) -> str:
+    """Content hash of the pages returned by an entity fields' endpoint"""
+    digest = hashlib.sha256()
+    for page in fields_pages:
+        digest.update(json.dumps(page, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def has_unknown_custom_fields(
+    data: TDataPage,
+    fields_mapping: "CompiledFieldsMapping",
+    seen_keys: Set[str],
+    seen_options: Optional[Set[Tuple[str, Any]]] = None,
+) -> bool:
+    """Tells if any row carries a custom field hash that is not in the mapping, or an enum or set option id that
+    has no label in the mapping.
+
+    `seen_keys` accumulates keys already checked so each distinct key is matched against the hash pattern once,
+    `seen_options` does the same for the values of enum and set fields.
+    """
+    known_hashes = fields_mapping.names
+    option_ids = fields_mapping.option_ids
+    for data_item in data:
+        new_keys = data_item.keys() - seen_keys
+        if new_keys:
+            seen_keys.update(new_keys)
+            for key in new_keys:
+                if key not in known_hashes and CUSTOM_FIELD_HASH_REGEX.match(key):
+                    return True
+        if seen_options is None:
+            continue
+        for key, known_ids in option_ids.items():
+            field_value = data_item.get(key)
+            if field_value is None or field_value == "":
+                continue
+            seen_value = (
+                key,
+                tuple(map(str, field_value)) if isinstance(field_value, list) else field_value,
+            )
+            if seen_value in seen_options:
+                continue
+            seen_options.add(seen_value)
+            for option_id in _coerce_to_list(field_value):
+                if isinstance(option_id, (str, int)) and str(option_id) not in known_ids:
+                    return True
+    return False
+
+
 def update_fields_mapping(
-    new_fields_mapping: TDataPage, existing_fields_mapping: Dict[str, Any]
+    new_fields_mapping: TDataPage,
+    existing_fields_mapping: Dict[str, Any],
+    naming: NamingConvention = None,
 ) -> Dict[str, Any]:
     """
     Specific function to perform data munging and push changes to custom fields' mapping stored in dlt's state
     The endpoint must be an entity fields' endpoint
+    Pass the source schema `naming` when called outside of the source or resource thread.
     """
     for data_item in new_fields_mapping:
         # 'edit_flag' field contains a boolean value, which is set to 'True' for custom fields and 'False' otherwise.
@@ -25,7 +104,9 @@ def update_fields_mapping(
             # Regarding custom fields, 'key' field contains pipedrive's hash string representation of its name
             # We assume that pipedrive's hash strings are meant to be an univoque representation of custom fields' name, so dlt's state shouldn't be updated while those values
             # remain unchanged
-            existing_fields_mapping = _update_field(data_item, existing_fields_mapping)
+            existing_fields_mapping = _update_field(
+                data_item, existing_fields_mapping, naming
+            )
         # Built in enum and set fields are mapped if their options have int ids
         # Enum fields with bool and string key options are left intact
         elif data_item.get("field_type") in {"set", "enum"}:
@@ -33,7 +114,7 @@ def update_fields_mapping(
             first_option = options[0]["id"] if len(options) >= 1 else None
             if isinstance(first_option, int) and not isinstance(first_option, bool):
                 existing_fields_mapping = _update_field(
-                    data_item, existing_fields_mapping
+                    data_item, existing_fields_mapping, naming
                 )
     return existing_fields_mapping
 
@@ -41,6 +122,7 @@ def update_fields_mapping(
 def _update_field(
     data_item: Dict[str, Any],
     existing_fields_mapping: Optional[Dict[str, TFieldMapping]],
+    naming: NamingConvention = None,
 ) -> Dict[str, TFieldMapping]:
     """Create or update the given field's info the custom fields state
     If the field hash already exists in the state from previous runs the name is not updated.
@@ -54,7 +136,7 @@ def _update_field(
     if not existing_field:
         existing_fields_mapping[key] = dict(
             name=data_item["name"],
-            normalized_name=_normalized_name(data_item["name"]),
+            normalized_name=_normalized_name(data_item["name"], naming),
             options=new_options_map,
             field_type=data_item["field_type"],
         )
@@ -65,7 +147,7 @@ def _update_field(
     new_name = data_item["name"]
     if existing_field["name"] != new_name:
         existing_field["name"] = new_name
-        existing_field["normalized_name"] = _normalized_name(new_name)
+        existing_field["normalized_name"] = _normalized_name(new_name, naming)
 
     # Keep field type in sync even if options did not change
     existing_field["field_type"] = data_item["field_type"]
@@ -87,10 +169,16 @@ def _update_field(
     return existing_fields_mapping
 
 
-def _normalized_name(name: str) -> str:
-    source_schema = dlt.current.source_schema()
+def _normalized_name(name: str, naming: NamingConvention = None) -> str:
+    if naming is None:
+        naming = dlt.current.source_schema().naming
+    return _normalize_identifier(naming, name)
+
+
+@lru_cache(maxsize=4096)
+def _normalize_identifier(naming: NamingConvention, name: str) -> str:
     normalized_name = name.strip()  # remove leading and trailing spaces
-    return source_schema.naming.normalize_identifier(normalized_name)
+    return naming.normalize_identifier(normalized_name)
 
 def _coerce_to_list(value):
     """
@@ -133,41 +221,103 @@ def _coerce_to_list(value):
         return [value]
 
 
-def rename_fields(data: TDataPage, fields_mapping: Dict[str, Any]) -> TDataPage:
+class CompiledFieldsMapping:
+    """Frozen lookup of custom field hashes to their names and value converters.
+
+    Field types and options are resolved once when compiled so renaming a row only touches the hash keys it
+    carries. Compile once per resource and pass it to `rename_fields` for every page.
+    """
+
+    __slots__ = ("_names", "_converters", "names", "converters", "field_types", "option_ids")
+
+    def __init__(self, fields_mapping: Dict[str, Any]) -> None:
+        self._names: Dict[str, str] = {
+            hash_string: field["name"] for hash_string, field in fields_mapping.items()
+        }
+        # only enum and set fields have converters, other field types are left as-is
+        self._converters: Dict[str, Callable[[Any], Any]] = {}
+        for hash_string, field in fields_mapping.items():
+            converter = _make_converter(field)
+            if converter is not None:
+                self._converters[hash_string] = converter
+        # read only views used by `rename_fields` and `has_unknown_custom_fields`
+        self.names: Mapping[str, str] = MappingProxyType(self._names)
+        self.converters: Mapping[str, Callable[[Any], Any]] = MappingProxyType(
+            self._converters
+        )
+        # Pipedrive field type of every hash, ie. `double` or `enum`
+        self.field_types: Mapping[str, str] = MappingProxyType(
+            {hash_string: field["field_type"] for hash_string, field in fields_mapping.items()}
+        )
+        # option ids with a label of every enum and set field
+        self.option_ids: Mapping[str, FrozenSet[str]] = MappingProxyType(
+            {
+                hash_string: frozenset(field.get("options") or ())
+                for hash_string, field in fields_mapping.items()
+                if field["field_type"] in {"enum", "set"}
+            }
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self._names)
+
+
+def compile_fields_mapping(fields_mapping: Dict[str, Any]) -> CompiledFieldsMapping:
+    return CompiledFieldsMapping(fields_mapping or {})
+
+
+def _make_converter(field: Dict[str, Any]) -> Optional[Callable[[Any], Any]]:
+    options_map: Dict[str, str] = dict(field.get("options") or {})
+
+    # MULTI-CHOICE ("set") — coerce to list then map each element using options_map (keys in state are strings)
+    def _convert_set(field_value: Any) -> List[Any]:
+        if type(field_value) is str and "[" not in field_value:
+            # fast path for the common comma separated ids
+            enum_ids = [p.strip() for p in field_value.split(",") if p.strip() != ""]
+        else:
+            enum_ids = _coerce_to_list(field_value)
+        labels = []
+        for enum_id in enum_ids:
+            label = options_map.get(str(enum_id))
+            # options without a label keep their id
+            labels.append(enum_id if label is None else label)
+        return labels
+
+    # SINGLE-CHOICE ("enum") — accept string/int or single-element list
+    def _convert_enum(field_value: Any) -> Any:
+        if type(field_value) is str:
+            return options_map.get(field_value, field_value)
+        # sometimes enum may come as a list with one item — normalize that
+        if isinstance(field_value, (list, tuple)) and len(field_value) == 1:
+            field_value = field_value[0]
+        return options_map.get(str(field_value), field_value)
+
+    if field["field_type"] == "set":
+        return _convert_set
+    if field["field_type"] == "enum":
+        return _convert_enum
+    # other field types left as-is
+    return None
+
+
+def rename_fields(
+    data: TDataPage, fields_mapping: Union[Dict[str, Any], CompiledFieldsMapping]
+) -> TDataPage:
     if not fields_mapping:
         return data
-    for data_item in data:
-        for hash_string, field in fields_mapping.items():
-            if hash_string not in data_item:
-                continue
-            field_value = data_item.pop(hash_string)
-            field_name = field["name"]
-            options_map = field.get("options") or {}
-
-            # MULTI-CHOICE ("set") — coerce to list then map using options_map
-            if field_value and field["field_type"] == "set":
-                coerced = _coerce_to_list(field_value)
-                # map each element using the options_map (keys in state are strings)
-                mapped = []
-                for enum_id in coerced:
-                    # try both str and int keys (options_map keys are strings, but id might be int)
-                    mapped_label = options_map.get(str(enum_id))
-                    if mapped_label is None and isinstance(enum_id, str) and enum_id.isdigit():
-                        # try integer form
-                        mapped_label = options_map.get(enum_id)
-                    mapped.append(mapped_label if mapped_label is not None else enum_id)
-                field_value = mapped
-
-            # SINGLE-CHOICE ("enum") — accept string/int or single-element list
-            elif field_value and field["field_type"] == "enum":
-                # sometimes enum may come as a list with one item — normalize that
-                if isinstance(field_value, (list, tuple)) and len(field_value) == 1:
-                    fv = field_value[0]
-                else:
-                    fv = field_value
-                # use mapping if available
-                field_value = options_map.get(str(fv), fv)
-
-            # else: other field types left as-is
-            data_item[field_name] = field_value
+    if not isinstance(fields_mapping, CompiledFieldsMapping):
+        fields_mapping = compile_fields_mapping(fields_mapping)
+    names = fields_mapping.names
+    converters = fields_mapping.converters
+    converter_keys = converters.keys()
+    for index, data_item in enumerate(data):
+        # map option ids only for the enum and set fields the row carries
+        for hash_string in converter_keys & data_item.keys():
+            field_value = data_item[hash_string]
+            if field_value:
+                data_item[hash_string] = converters[hash_string](field_value)
+        # rename all hash keys in one pass
+        data[index] = {
+            names.get(key, key): value for key, value in data_item.items()
+        }
     return data
@@ -0,0 +1,107 @@
+"""Decoding of Pipedrive api responses
+
+Response bodies are parsed with orjson straight from bytes, skipping the text decoding and stdlib parser of
+`requests.Response.json()`. orjson needs the whole body in memory next to the decoded page, so bodies larger
+than JSON_STREAMING_MIN_BYTES are parsed incrementally from the socket with ijson instead. The length of a
+gzipped or chunked body is not known upfront, the first JSON_STREAMING_MIN_BYTES decompressed bytes are read to
+tell small bodies from large ones.
+
+Reads from the socket are timed apart from parsing, also when both are interleaved by ijson, so a slow
+download is not reported as slow decoding.
+"""
+
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import orjson
+from dlt.common.exceptions import MissingDependencyException
+from requests import Response
+
+from ..settings import JSON_STREAMING_MIN_BYTES
+
+
+class TDecodedResponse(NamedTuple):
+    page: Dict[str, Any]
+    # decompressed body length and seconds spent reading it from the socket
+    size: int
+    read_seconds: float
+
+
+def decode_response(
+    response: Response, charge: Optional[Callable[[int], None]] = None
+) -> TDecodedResponse:
+    """Reads and decodes the json body of a response requested with `stream=True`, `charge` is called with
+    the length of every decompressed chunk as it is read
+    """
+    # let urllib3 decompress gzip and deflate bodies
+    response.raw.decode_content = True
+    reader = _BodyReader(response.raw, charge)
+    try:
+        if JSON_STREAMING_MIN_BYTES is None:
+            page = decode_content(reader.read())
+        else:
+            head = reader.read(JSON_STREAMING_MIN_BYTES)
+            if len(head) < JSON_STREAMING_MIN_BYTES:
+                # short read at the end of the body, urllib3 fills reads of decoded content otherwise
+                page = decode_content(head + reader.read())
+            else:
+                reader.unread(head)
+                page = _decode_stream(reader)
+                # consume the end of a chunked body so the connection goes back to the pool
+                reader.read()
+    finally:
+        response.close()
+    return TDecodedResponse(page, reader.size, reader.seconds)
+
+
+def decode_content(content: bytes) -> Dict[str, Any]:
+    """Decodes a json body that was already read"""
+    return orjson.loads(content)  # type: ignore[no-any-return]
+
+
+def _decode_stream(body: Any) -> Dict[str, Any]:
+    """Builds the top level object of the body key by key while it is read"""
+    try:
+        import ijson
+    except ModuleNotFoundError:
+        raise MissingDependencyException("Pipedrive streaming json decoding", ["ijson"])
+
+    return dict(ijson.kvitems(body, "", use_float=True))
+
+
+class _BodyReader:
+    """File-like reader of a response body counting the decompressed bytes and seconds read from `raw`.
+    Bytes passed to `unread` are returned again before the rest of the body.
+    """
+
+    def __init__(self, raw: Any, charge: Optional[Callable[[int], None]] = None) -> None:
+        self.raw = raw
+        self.charge = charge
+        self.size = 0
+        self.seconds = 0.0
+        self._head = b""
+        self._position = 0
+
+    def unread(self, head: bytes) -> None:
+        self._head = head
+        self._position = 0
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if size is None or size < 0:
+            head = self._head[self._position :]
+            self._position = len(self._head)
+            return head + self._read(None)
+        if self._position < len(self._head):
+            chunk = self._head[self._position : self._position + size]
+            self._position += len(chunk)
+            return chunk
+        return self._read(size)
+
+    def _read(self, size: Optional[int]) -> bytes:
+        started = time.perf_counter()
+        chunk = self.raw.read(size)
+        self.seconds += time.perf_counter() - started
+        self.size += len(chunk)
+        if self.charge is not None:
+            self.charge(len(chunk))
+        return chunk  # type: ignore[no-any-return]
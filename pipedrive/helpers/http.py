@@ -0,0 +1,66 @@
+"""Shared HTTP client of the Pipedrive helpers
+
+All requests of a run go through one client. Its connection pool is sized for MAX_CONCURRENT_REQUESTS, so
+keep-alive connections are reused by every resource and worker thread instead of being reopened. The client
+negotiates gzip and, when `brotli` is installed, br compression.
+
+`requests` speaks HTTP/1.1 only. With pooled keep-alive connections most of the gain of HTTP/2 multiplexing
+is already there, so HTTP/2 is not offered.
+
+Requests go to PIPEDRIVE_API_URL, which may be overridden with the environment variable of the same name,
+ie. to point the source at the stand-in server of `benchmarks/bench_pipeline.py`.
+"""
+
+import os
+from typing import Any, Dict
+
+from dlt.sources.helpers import requests
+from requests.utils import default_headers
+from urllib3.util.request import ACCEPT_ENCODING
+
+from ..settings import MAX_CONCURRENT_REQUESTS
+
+PIPEDRIVE_API_URL = os.environ.get("PIPEDRIVE_API_URL", "https://api.pipedrive.com").rstrip("/")
+
+
+def make_client(pool_size: int = MAX_CONCURRENT_REQUESTS) -> requests.Client:
+    """Creates a client with a keep-alive connection pool of `pool_size` connections per host.
+
+    429 responses are returned to the caller so the rate limiter sees them, server errors are retried.
+    """
+    headers = default_headers()
+    headers.update(
+        {
+            "Accept": "application/json",
+            "Accept-Encoding": ACCEPT_ENCODING,
+            "Connection": "keep-alive",
+        }
+    )
+    return requests.Client(
+        max_connections=pool_size,
+        raise_for_status=False,
+        status_codes=tuple(range(500, 600)),
+        session_attrs={"headers": headers},
+    )
+
+
+def connection_stats(client: requests.Client) -> Dict[str, Any]:
+    """Counts requests sent and connections opened by the pool of `client` in this process"""
+    pool_manager = client.session.get_adapter(PIPEDRIVE_API_URL).poolmanager
+    requests_count = 0
+    connections_count = 0
+    for key in pool_manager.pools.keys():
+        pool = pool_manager.pools.get(key)
+        if pool is None:
+            continue
+        requests_count += pool.num_requests
+        connections_count += pool.num_connections
+    return {
+        "requests": requests_count,
+        "connections": connections_count,
+        "reused_connections": max(requests_count - connections_count, 0),
+        "reuse_ratio": 1 - connections_count / requests_count if requests_count else 0.0,
+    }
+
+
+http_client = make_client()
@@ -0,0 +1,60 @@
+"""Process-wide budget of response bodies held by paginations
+
+Every page is charged with its decompressed body bytes while the body is read, before it is decoded, and the
+charge is released once the consumer resumes after the page was yielded, so renamed and converted pages are
+covered too. All paginations are charged, prefetching ones stop requesting windows ahead while the budget is
+exhausted. Each pagination keeps at least one request in flight, so the limit may be exceeded by one page
+per resource but never stops extraction. The limit counts body bytes, decoded pages take a few times more.
+"""
+
+import threading
+from typing import Optional
+
+from ..settings import STREAMING_MEMORY_LIMIT
+
+
+class MemoryBudget:
+    def __init__(self, limit: Optional[int]) -> None:
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.limit is not None and self.used >= self.limit
+
+    def charge(self, size: int) -> None:
+        with self._lock:
+            self.used += size
+
+    def release(self, size: int) -> None:
+        with self._lock:
+            self.used -= size
+
+
+class MemoryCharge:
+    """Bytes of one or more pages charged to `budget` until `release` is called. Bytes added after the
+    release, ie. by a request still running when its pagination was closed, are not charged.
+    """
+
+    def __init__(self, budget: MemoryBudget) -> None:
+        self.budget = budget
+        self.size = 0
+        self._released = False
+        self._lock = threading.Lock()
+
+    def add(self, size: int) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self.size += size
+            self.budget.charge(size)
+
+    def release(self) -> None:
+        with self._lock:
+            self._released = True
+            size, self.size = self.size, 0
+            self.budget.release(size)
+
+
+streaming_budget = MemoryBudget(STREAMING_MEMORY_LIMIT)
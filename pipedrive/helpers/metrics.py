@@ -0,0 +1,224 @@
+"""Per-resource extraction timings and counters collected while the source is being extracted
+
+Timings measure the wall-clock time of recents resources. Counters record, per resource, where that time
+goes: requests, 429 retries, throttle waits, bytes, http and json decode time, transform time, rows and pages
+yielded, rows dropped, response cache hits and requests deferred by the streaming memory limit.
+Both are reported by `metrics_report` and written as json or OpenMetrics text by `write_metrics`.
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, TypedDict
+
+
+class TResourceTiming(TypedDict):
+    resource: str
+    started_at: float
+    finished_at: float
+    elapsed: float
+    pages: int
+
+
+class TResourceMetrics(TypedDict):
+    resource: str
+    requests: int
+    throttle_retries: int
+    throttle_seconds: float
+    http_seconds: float
+    bytes: int
+    decode_seconds: float
+    transform_seconds: float
+    rows: int
+    pages: int
+    dropped_rows: int
+    cache_hits: int
+    not_modified: int
+    deferred_requests: int
+
+
+# help text of every counter, in report order
+METRICS_HELP = {
+    "requests": "Requests sent",
+    "throttle_retries": "Requests retried after a 429 response",
+    "throttle_seconds": "Seconds spent waiting for the rate limiter and the request budget",
+    "http_seconds": "Seconds spent waiting for responses and reading their bodies",
+    "bytes": "Decompressed response body bytes",
+    "decode_seconds": "Seconds spent parsing response bodies",
+    "transform_seconds": "Seconds spent renaming custom fields and converting pages",
+    "rows": "Rows yielded",
+    "pages": "Pages yielded",
+    "dropped_rows": "Duplicate and unchanged rows dropped before transform",
+    "cache_hits": "Responses served from the response cache without a request",
+    "not_modified": "Cached responses revalidated by a 304 response",
+    "deferred_requests": "Times requests ahead of the consumer were deferred by the streaming memory limit",
+}
+
+_lock = threading.Lock()
+_timings: Dict[str, TResourceTiming] = {}
+_metrics: Dict[str, TResourceMetrics] = {}
+
+
+@contextmanager
+def track_resource_time(resource_name: str) -> Iterator[TResourceTiming]:
+    """Measures wall-clock time from the first to the last page of a resource.
+
+    The yielded record may be used to count pages, it is stored when the resource is exhausted or closed.
+    """
+    started_at = time.time()
+    timing = TResourceTiming(
+        resource=resource_name,
+        started_at=started_at,
+        finished_at=started_at,
+        elapsed=0.0,
+        pages=0,
+    )
+    try:
+        yield timing
+    finally:
+        timing["finished_at"] = time.time()
+        timing["elapsed"] = timing["finished_at"] - started_at
+        with _lock:
+            _timings[resource_name] = timing
+
+
+def resource_timings() -> List[TResourceTiming]:
+    """Returns timings of all resources extracted in this process, slowest first"""
+    with _lock:
+        timings = list(_timings.values())
+    return sorted(timings, key=lambda t: t["elapsed"], reverse=True)
+
+
+def timing_report() -> Dict[str, Any]:
+    """Summarizes resource timings and compares the wall-clock time with the serial sum"""
+    timings = resource_timings()
+    if not timings:
+        return {"wall_clock": 0.0, "serial_sum": 0.0, "speedup": 1.0, "resources": []}
+    wall_clock = max(t["finished_at"] for t in timings) - min(
+        t["started_at"] for t in timings
+    )
+    serial_sum = sum(t["elapsed"] for t in timings)
+    return {
+        "wall_clock": wall_clock,
+        "serial_sum": serial_sum,
+        "speedup": serial_sum / wall_clock if wall_clock else 1.0,
+        "resources": timings,
+    }
+
+
+def reset_timings() -> None:
+    with _lock:
+        _timings.clear()
+        _metrics.clear()
+
+
+def resource_metrics(resource_name: str) -> TResourceMetrics:
+    """Returns the counters of `resource_name` in this process, update them with `add_metrics`"""
+    with _lock:
+        metrics = _metrics.get(resource_name)
+        if metrics is None:
+            metrics = _metrics[resource_name] = TResourceMetrics(
+                resource=resource_name,
+                requests=0,
+                throttle_retries=0,
+                throttle_seconds=0.0,
+                http_seconds=0.0,
+                bytes=0,
+                decode_seconds=0.0,
+                transform_seconds=0.0,
+                rows=0,
+                pages=0,
+                dropped_rows=0,
+                cache_hits=0,
+                not_modified=0,
+                deferred_requests=0,
+            )
+        return metrics
+
+
+def add_metrics(metrics: Optional[TResourceMetrics], **increments: float) -> None:
+    """Adds `increments` to the counters of `metrics`, safe to call from worker threads"""
+    if metrics is None:
+        return
+    with _lock:
+        for counter, value in increments.items():
+            metrics[counter] += value  # type: ignore[literal-required]
+
+
+@contextmanager
+def measure(metrics: Optional[TResourceMetrics], counter: str) -> Iterator[None]:
+    """Adds the seconds spent in the block to `counter` of `metrics`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_metrics(metrics, **{counter: time.perf_counter() - started})
+
+
+def metrics_report() -> Dict[str, Any]:
+    """Timing report with the counters of every resource, resources with most time spent first"""
+    report = timing_report()
+    timings = {timing["resource"]: timing for timing in report["resources"]}
+    with _lock:
+        metrics = {name: dict(counters) for name, counters in _metrics.items()}
+    resources: List[Dict[str, Any]] = []
+    for name in set(timings) | set(metrics):
+        resource: Dict[str, Any] = {"resource": name}
+        resource.update(metrics.get(name, {}))
+        if name in timings:
+            resource["elapsed"] = timings[name]["elapsed"]
+            resource["pages"] = max(resource.get("pages", 0), timings[name]["pages"])
+        resources.append(resource)
+    resources.sort(
+        key=lambda r: r.get("elapsed", r.get("http_seconds", 0.0)), reverse=True
+    )
+    report["resources"] = resources
+    report["totals"] = {
+        counter: sum(resource.get(counter, 0) for resource in resources)
+        for counter in METRICS_HELP
+    }
+    return report
+
+
+def format_openmetrics(report: Dict[str, Any], prefix: str = "pipedrive") -> str:
+    """Formats `metrics_report` in the OpenMetrics text exposition format"""
+    lines = []
+    for counter, help_text in METRICS_HELP.items():
+        name = f"{prefix}_{counter}"
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"# HELP {name} {help_text}")
+        for resource in report["resources"]:
+            if counter in resource:
+                lines.append(
+                    f'{name}_total{{resource="{resource["resource"]}"}} {resource[counter]}'
+                )
+    name = f"{prefix}_resource_elapsed_seconds"
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f"# HELP {name} Wall-clock seconds from the first to the last page")
+    for resource in report["resources"]:
+        if "elapsed" in resource:
+            lines.append(f'{name}{{resource="{resource["resource"]}"}} {resource["elapsed"]}')
+    for key in ("wall_clock", "serial_sum"):
+        name = f"{prefix}_extract_{key}_seconds"
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {report[key]}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(metrics_format: str = "json", path: Optional[str] = None) -> None:
+    """Writes `metrics_report` as "json" or "openmetrics" to `path`, stdout if not set"""
+    report = metrics_report()
+    if metrics_format == "json":
+        text = json.dumps(report, indent=2) + "\n"
+    elif metrics_format == "openmetrics":
+        text = format_openmetrics(report)
+    else:
+        raise ValueError(f"Unknown metrics format {metrics_format}, use json or openmetrics")
+    if path is None:
+        sys.stdout.write(text)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
@@ -0,0 +1,99 @@
+"""Per-endpoint page size tuned from the payload size and latency of fetched pages
+
+Every endpoint starts at its PAGE_SIZES entry (MAX_PAGE_SIZE by default). After each page the tuner moves
+the size towards the largest one whose estimated body stays under PAGE_TARGET_BYTES and whose estimated
+latency stays under PAGE_TARGET_SECONDS, never above the Pipedrive maximum of MAX_PAGE_SIZE rows.
+"""
+
+import re
+import threading
+from typing import Dict, Optional
+
+from ..settings import (
+    MAX_PAGE_SIZE,
+    MIN_PAGE_SIZE,
+    PAGE_SIZES,
+    PAGE_TARGET_BYTES,
+    PAGE_TARGET_SECONDS,
+)
+
+# weight of the latest page in the moving averages
+SMOOTHING = 0.5
+# page sizes are multiples of this step so offsets stay readable
+PAGE_SIZE_STEP = 50
+
+
+class PageSizeTuner:
+    def __init__(
+        self,
+        initial: int = MAX_PAGE_SIZE,
+        min_size: int = MIN_PAGE_SIZE,
+        max_size: int = MAX_PAGE_SIZE,
+        target_bytes: float = PAGE_TARGET_BYTES,
+        target_seconds: float = PAGE_TARGET_SECONDS,
+    ) -> None:
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self._limit = self._clamp(initial)
+        self._bytes_per_row: Optional[float] = None
+        self._seconds_per_row: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    def observe(self, rows: int, size_bytes: int, elapsed: float) -> None:
+        """Updates the page size from a page of `rows` rows, `size_bytes` long, fetched in `elapsed` seconds"""
+        if rows <= 0:
+            return
+        with self._lock:
+            self._bytes_per_row = _average(self._bytes_per_row, size_bytes / rows)
+            self._seconds_per_row = _average(self._seconds_per_row, elapsed / rows)
+            candidates = [self.max_size]
+            if self._bytes_per_row:
+                candidates.append(int(self.target_bytes / self._bytes_per_row))
+            if self._seconds_per_row:
+                candidates.append(int(self.target_seconds / self._seconds_per_row))
+            # grow at most twofold per page so a single fast page does not cause a memory spike
+            self._limit = self._clamp(min(min(candidates), self._limit * 2))
+
+    def _clamp(self, size: int) -> int:
+        if size > PAGE_SIZE_STEP:
+            size -= size % PAGE_SIZE_STEP
+        return max(self.min_size, min(self.max_size, size))
+
+
+def _average(current: Optional[float], value: float) -> float:
+    if current is None:
+        return value
+    return current + SMOOTHING * (value - current)
+
+
+_tuners: Dict[str, PageSizeTuner] = {}
+_tuners_lock = threading.Lock()
+
+
+def endpoint_key(endpoint: str) -> str:
+    """Endpoints that differ only by ids, ie. `deals/1/flow`, share a page size"""
+    return re.sub(r"/\d+(?=/|$)", "", endpoint)
+
+
+def page_size_tuner(endpoint: str, initial: Optional[int] = None) -> PageSizeTuner:
+    """Returns the process-wide tuner of `endpoint`, created with `initial` or its PAGE_SIZES entry"""
+    key = endpoint_key(endpoint)
+    with _tuners_lock:
+        tuner = _tuners.get(key)
+        if tuner is None:
+            if initial is None:
+                initial = PAGE_SIZES.get(key, MAX_PAGE_SIZE)
+            tuner = _tuners[key] = PageSizeTuner(initial)
+        return tuner
+
+
+def page_sizes() -> Dict[str, int]:
+    """Current page size of every endpoint requested in this process"""
+    with _tuners_lock:
+        return {key: tuner.limit for key, tuner in _tuners.items()}
@@ -1,23 +1,92 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from copy import deepcopy
+from functools import partial
 from itertools import chain
+import re
+from threading import BoundedSemaphore, Lock
+import time
 from typing import (
     Any,
+    Deque,
     Dict,
-    Iterable,
     Iterator,
     List,
+    Optional,
+    Set,
+    Tuple,
     TypeVar,
     Union,
 )
 
 import dlt
+from dlt.common.normalizers.naming import NamingConvention
 from dlt.sources.helpers import requests
 
-from .custom_fields_munger import rename_fields
-from ..typing import TDataPage
+from .content_hash import ContentHashFilter, lookup_content_hashes
+from .custom_fields_munger import (
+    TFieldsMappingRefresh,
+    compile_fields_mapping,
+    fields_fingerprint,
+    has_unknown_custom_fields,
+    rename_fields,
+    update_fields_mapping,
+)
+from .decoding import TDecodedResponse, decode_content, decode_response
+from .http import PIPEDRIVE_API_URL, http_client
+from .metrics import (
+    TResourceMetrics,
+    add_metrics,
+    measure,
+    resource_metrics,
+    track_resource_time,
+)
+from .memory_budget import MemoryCharge, streaming_budget
+from .page_size import PageSizeTuner, page_size_tuner
+from .rate_limit import rate_limiter
+from .response_cache import ResponseCache, TCachedResponse, response_cache
+from ..settings import (
+    API_VERSIONS,
+    ARROW_CURSOR_COLUMN,
+    ARROW_ENTITIES,
+    CONTENT_HASH_ENTITIES,
+    CUSTOM_FIELDS_TTL,
+    ENTITY_MAPPINGS,
+    MAX_CONCURRENT_REQUESTS,
+    PAGINATION_CONCURRENCY,
+    PAGINATION_TIME_BUDGET,
+    RATE_LIMIT_MAX_RETRIES,
+    RESPONSE_CACHE_TTLS,
+    V2_ENTITIES,
+)
+from ..typing import TDataPage, TPaginationCheckpoint
 
+# global request budget shared by all resources extracted in parallel
+_request_budget = BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+# entities with custom fields and their fields' endpoint
+FIELDS_ENTITIES = {
+    entity: fields_entity
+    for entity, fields_entity, _ in ENTITY_MAPPINGS
+    if fields_entity is not None
+}
+# a mapping is refreshed by one caller at a time, other callers of the same entity wait and reuse it
+_fields_mapping_locks = {entity: Lock() for entity in FIELDS_ENTITIES}
+# RFC 3339 timestamps of v2 responses, ie. `2024-01-31T10:00:00Z`
+V2_TIMESTAMP_REGEX = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|\+00:00)$")
 
 def get_pages(
-    entity: str, pipedrive_api_key: str, extra_params: Dict[str, Any] = None
+    entity: str,
+    pipedrive_api_key: str,
+    extra_params: Dict[str, Any] = None,
+    concurrency: int = 1,
+    start: int = 0,
+    progress: Dict[str, Any] = None,
+    client: requests.Client = None,
+    tuner: PageSizeTuner = None,
+    metrics: TResourceMetrics = None,
+    cache_ttl: Optional[float] = None,
+    charge: MemoryCharge = None,
 ) -> Iterator[List[Dict[str, Any]]]:
     """
     Generic method to retrieve endpoint data based on the required headers and params.
@@ -26,16 +95,201 @@ def get_pages(
         entity: the endpoint you want to call
         pipedrive_api_key:
         extra_params: any needed request params except pagination.
+        concurrency: number of offset windows fetched ahead of the consumer, 1 disables prefetching.
+        start: offset of the first page.
+        progress: if passed, `next_start` is set to the offset following each yielded page, None after the last one.
+        client: http client sending the requests, the shared keep-alive client by default.
+        tuner: page size tuner of the endpoint, by default the process-wide tuner of `entity`.
+        metrics: counters of the resource the requests are made for.
+        cache_ttl: seconds a cached response is used without a request, by default the RESPONSE_CACHE_TTLS entry
+            of `entity` unless the request is filtered by `since_timestamp`. 0 revalidates cached responses. Used
+            only if RESPONSE_CACHE_PATH is set.
+        charge: memory charge the bodies of all pages are added to, released by the caller. By default each
+            page is charged to the streaming memory budget until the consumer resumes after it.
 
     Returns:
 
     """
-    headers = {"Content-Type": "application/json", "x-api-token": pipedrive_api_key}
+    # common headers are set on the session of the shared client
+    headers = {"x-api-token": pipedrive_api_key}
     params = {}
     if extra_params:
         params.update(extra_params)
-    url = f"https://api.pipedrive.com/v1/{entity}"
-    yield from _paginated_get(url, headers=headers, params=params)
+    url = f"{PIPEDRIVE_API_URL}/v1/{entity}"
+    # incremental requests are keyed by their cursor, caching them only grows the cache
+    if cache_ttl is None and "since_timestamp" not in params:
+        cache_ttl = RESPONSE_CACHE_TTLS.get(entity)
+    yield from _paginated_get(
+        url,
+        headers=headers,
+        params=params,
+        concurrency=concurrency,
+        start=start,
+        progress=progress,
+        client=client,
+        tuner=tuner or page_size_tuner(entity),
+        metrics=metrics,
+        cache_ttl=cache_ttl,
+        charge=charge,
+    )
+
+
+def get_pages_v2(
+    entity: str,
+    pipedrive_api_key: str,
+    updated_since: str = None,
+    extra_params: Dict[str, Any] = None,
+    cursor: str = None,
+    progress: Dict[str, Any] = None,
+    client: requests.Client = None,
+    tuner: PageSizeTuner = None,
+    metrics: TResourceMetrics = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Retrieves an /api/v2 endpoint page by page following its `next_cursor`.
+
+    Rows are normalized to the v1 shape the resources expect: values of `custom_fields` are moved to the top
+    level of the row under their field hash and timestamps are formatted as `YYYY-MM-DD HH:MM:SS`.
+
+    Args:
+        entity: the v2 endpoint you want to call, ie. `deals`
+        pipedrive_api_key:
+        updated_since: only rows updated at or after this `YYYY-MM-DD HH:MM:SS` timestamp are returned.
+        extra_params: any needed request params except pagination.
+        cursor: cursor of the first page, None starts at the beginning of the collection.
+        progress: if passed, `next_start` is set to the cursor following each yielded page, None after the last one.
+        client: http client sending the requests, the shared keep-alive client by default.
+        tuner: page size tuner of the endpoint, by default the process-wide tuner of `entity`.
+        metrics: counters of the resource the requests are made for.
+
+    Each page is charged to the streaming memory budget until the consumer resumes after it.
+    """
+    if progress is None:
+        progress = {}
+    if tuner is None:
+        tuner = page_size_tuner(entity)
+    headers = {"x-api-token": pipedrive_api_key}
+    params: Dict[str, Any] = {}
+    if extra_params:
+        params.update(extra_params)
+    if updated_since:
+        params["updated_since"] = _to_rfc3339(updated_since)
+    url = f"{PIPEDRIVE_API_URL}/api/v2/{entity}"
+    while True:
+        params["limit"] = tuner.limit
+        if cursor:
+            params["cursor"] = cursor
+        charge = MemoryCharge(streaming_budget)
+        try:
+            page = _fetch_page(url, headers, params, client, tuner, metrics, charge=charge)
+            cursor = (page.get("additional_data") or {}).get("next_cursor")
+            progress["next_start"] = cursor or None
+            data = page["data"]
+            if data:
+                yield _normalize_v2_rows(data)
+        finally:
+            charge.release()
+        if not cursor:
+            break
+
+
+def _to_rfc3339(timestamp: str) -> str:
+    """`YYYY-MM-DD HH:MM:SS` (UTC) as expected by v2 filters"""
+    return timestamp.replace(" ", "T", 1) + "Z"
+
+
+def _normalize_v2_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for row in rows:
+        custom_fields = row.pop("custom_fields", None)
+        if custom_fields:
+            row.update(custom_fields)
+        for key, value in row.items():
+            if isinstance(value, str) and V2_TIMESTAMP_REGEX.match(value):
+                row[key] = f"{value[:10]} {value[11:19]}"
+    return rows
+
+
+def api_version(entity: str) -> str:
+    """Api version of `entity` set in API_VERSIONS, v1 by default"""
+    version = API_VERSIONS.get(entity, "v1")
+    if version not in ("v1", "v2"):
+        raise ValueError(f"Unknown Pipedrive api version {version} of {entity}")
+    if version == "v2" and entity not in V2_ENTITIES:
+        raise ValueError(f"{entity} has no v2 endpoint, use one of {sorted(V2_ENTITIES)}")
+    return version
+
+
+def refresh_fields_mapping(
+    entity: str,
+    pipedrive_api_key: str,
+    force: bool = False,
+    state: Dict[str, Any] = None,
+    naming: NamingConvention = None,
+) -> Dict[str, Any]:
+    """
+    Returns the custom fields mapping of `entity` kept in source state, refetching its fields' endpoint
+    only when the mapping is older than CUSTOM_FIELDS_TTL or `force` is set.
+    The mapping is rebuilt only when the content fingerprint of the fields changed since the last fetch.
+
+    Safe to call from worker threads if source `state` and schema `naming` are passed, concurrent callers of
+    the same entity wait for the one refreshing it.
+    """
+    if state is None:
+        state = dlt.current.source_state()
+    if naming is None:
+        naming = dlt.current.source_schema().naming
+    with _fields_mapping_locks[entity]:
+        return _refresh_fields_mapping(entity, pipedrive_api_key, force, state, naming)
+
+
+def _refresh_fields_mapping(
+    entity: str,
+    pipedrive_api_key: str,
+    force: bool,
+    state: Dict[str, Any],
+    naming: NamingConvention,
+) -> Dict[str, Any]:
+    custom_fields_mapping: Dict[str, Any] = state.setdefault("custom_fields_mapping", {})
+    refreshes: Dict[str, TFieldsMappingRefresh] = state.setdefault(
+        "custom_fields_refresh", {}
+    )
+    refresh = refreshes.get(entity)
+    now = time.time()
+    if (
+        not force
+        and refresh
+        and entity in custom_fields_mapping
+        and now - refresh["fetched_at"] < CUSTOM_FIELDS_TTL
+    ):
+        return custom_fields_mapping[entity]  # type: ignore[no-any-return]
+
+    # we need to process all pages before updating the mapping
+    metrics = resource_metrics("custom_fields_mapping")
+    # a forced refresh must see the current fields, cached responses are revalidated
+    fields_pages = list(
+        get_pages(
+            FIELDS_ENTITIES[entity],
+            pipedrive_api_key,
+            metrics=metrics,
+            cache_ttl=0 if force else None,
+        )
+    )
+    fingerprint = fields_fingerprint(fields_pages)
+    if (
+        not refresh
+        or refresh["fingerprint"] != fingerprint
+        or entity not in custom_fields_mapping
+    ):
+        # updated on a copy so callers compiling the current mapping never see it change
+        existing_fields_mapping = deepcopy(custom_fields_mapping.get(entity, {}))
+        with measure(metrics, "transform_seconds"):
+            for page in fields_pages:
+                existing_fields_mapping = update_fields_mapping(
+                    page, existing_fields_mapping, naming
+                )
+        custom_fields_mapping[entity] = existing_fields_mapping
+    refreshes[entity] = TFieldsMappingRefresh(fingerprint=fingerprint, fetched_at=now)
+    return custom_fields_mapping[entity]  # type: ignore[no-any-return]
 
 
 def get_recent_items_incremental(
@@ -45,43 +299,371 @@ def get_recent_items_incremental(
     since_timestamp: dlt.sources.incremental[str] = dlt.sources.incremental(
         "update_time|modified", "1970-01-01 00:00:00"
     ),
+    full_refresh: bool = False,
+    start: Union[int, str] = 0,
 ) -> Iterator[TDataPage]:
-    """Get a specific entity type from /recents with incremental state."""
-    yield from _get_recent_pages(entity, resource_name, pipedrive_api_key, since_timestamp.last_value)
+    """Get a specific entity type from /recents, or its v2 endpoint, with incremental state.
+    A completed full refresh is recorded in source state as `last_full_refresh`.
+
+    Progress is checkpointed in source state after every page. A resource that exceeds PAGINATION_TIME_BUDGET
+    stops early and keeps its checkpoint, the next run resumes at its `next_start` with the same cursor.
+    `start` is an offset for v1 entities and a cursor for v2 entities.
+
+    Rows of CONTENT_HASH_ENTITIES that are duplicated or unchanged since their last load are dropped, their
+    content hashes are loaded with them and read back from the destination table.
+    """
+    refresh_started_at = time.time()
+    state = dlt.current.source_state()
+    checkpoints: Dict[str, TPaginationCheckpoint] = state.setdefault(
+        "pagination_checkpoints", {}
+    )
+    # the cursor advances while pages are processed, offsets are only valid for the initial one
+    cursor = since_timestamp.last_value
+    page_sizes: Dict[str, int] = state.setdefault("page_sizes", {})
+    tuner = page_size_tuner(resource_name, page_sizes.get(resource_name))
+    # incrementals with an end value keep no cursor state, the highest cursor is committed when done
+    cursor_fields = since_timestamp.cursor_path.split("|")
+    max_cursor = None
+    content_filter = None
+    # the index was kept in source state before it moved to the destination tables
+    state.pop("content_hashes", None)
+    if entity in CONTENT_HASH_ENTITIES:
+        content_filter = ContentHashFilter(
+            None if full_refresh else partial(lookup_content_hashes, resource_name), cursor_fields
+        )
+    progress: Dict[str, Any] = {"next_start": start}
+    metrics = resource_metrics(resource_name)
+    with track_resource_time(resource_name) as timing:
+        for page in _get_recent_pages(
+            entity,
+            resource_name,
+            pipedrive_api_key,
+            cursor,
+            start,
+            progress,
+            metrics,
+            content_filter,
+        ):
+            # pages with all rows dropped are not yielded but still checkpointed
+            if len(page):
+                timing["pages"] += 1
+                if since_timestamp.end_value is not None:
+                    max_cursor = _max_cursor(page, cursor_fields, max_cursor)
+                yield page
+            if progress["next_start"] is None:
+                continue
+            checkpoints[resource_name] = TPaginationCheckpoint(
+                since_timestamp=cursor,
+                next_start=progress["next_start"],
+                full_refresh=full_refresh,
+                updated_at=time.time(),
+            )
+            page_sizes[resource_name] = tuner.limit
+            if (
+                PAGINATION_TIME_BUDGET is not None
+                and time.time() - refresh_started_at > PAGINATION_TIME_BUDGET
+            ):
+                print(
+                    f"{resource_name}: time budget exceeded, resuming at {progress['next_start']} on next run"
+                )
+                return
+    checkpoints.pop(resource_name, None)
+    if full_refresh:
+        state["last_full_refresh"] = refresh_started_at
+    # dropped rows do not advance the cursor in dlt, it is moved past them so they are not requested again
+    if content_filter is not None and (
+        content_filter.duplicate_rows or content_filter.unchanged_rows
+    ):
+        max_cursor = content_filter.max_cursor
+    if max_cursor is not None:
+        commit_cursor(resource_name, since_timestamp, max_cursor)
+
+
+def _max_cursor(page: Any, cursor_fields: List[str], max_cursor: Any) -> Any:
+    if isinstance(page, list):
+        values = [
+            value
+            for value in (
+                next((row[field] for field in cursor_fields if row.get(field)), None)
+                for row in page
+            )
+            if value is not None
+        ]
+        page_max = max(values, default=None)
+    else:
+        # arrow table with a single cursor column
+        import pyarrow.compute as pc
+
+        page_max = pc.max(page[cursor_fields[0]]).as_py()
+    if page_max is None or (max_cursor is not None and max_cursor >= page_max):
+        return max_cursor
+    return page_max
+
+
+def commit_cursor(
+    resource_name: str, since_timestamp: dlt.sources.incremental[str], max_cursor: str
+) -> None:
+    """Advances the incremental state of `resource_name` to `max_cursor` as dlt would after a stateful run"""
+    incremental_state = (
+        dlt.current.resource_state(resource_name)
+        .setdefault("incremental", {})
+        .setdefault(
+            since_timestamp.cursor_path,
+            {"initial_value": since_timestamp.initial_value, "unique_hashes": []},
+        )
+    )
+    last_value = incremental_state.get("last_value")
+    if last_value is None or max_cursor > last_value:
+        incremental_state["last_value"] = max_cursor
 
 
 def _paginated_get(
-    url: str, headers: Dict[str, Any], params: Dict[str, Any]
+    url: str,
+    headers: Dict[str, Any],
+    params: Dict[str, Any],
+    concurrency: int = 1,
+    start: int = 0,
+    progress: Dict[str, Any] = None,
+    client: requests.Client = None,
+    tuner: PageSizeTuner = None,
+    metrics: TResourceMetrics = None,
+    cache_ttl: Optional[float] = None,
+    charge: MemoryCharge = None,
 ) -> Iterator[List[Dict[str, Any]]]:
     """
-    Requests and yields data 500 records at a time
+    Requests and yields data up to 500 records at a time, the page size is set by `tuner` before every request
     Documentation: https://pipedrive.readme.io/docs/core-api-concepts-pagination
+
+    Pages are charged to `charge` if passed, otherwise each to the streaming memory budget until the consumer
+    resumes after it.
     """
+    if progress is None:
+        progress = {}
+    if client is None:
+        client = http_client
+    if tuner is None:
+        tuner = PageSizeTuner()
     # pagination start and page limit
-    params["start"] = 0
-    params["limit"] = 500
+    params["start"] = start
+    if concurrency > 1:
+        yield from _prefetched_paginated_get(
+            url, headers, params, concurrency, progress, client, tuner, metrics, cache_ttl, charge
+        )
+        return
     while True:
-        page = requests.get(url, headers=headers, params=params).json()
-        # yield data only
-        data = page["data"]
-        if data:
-            yield data
-        # check if next page exists
-        pagination_info = page.get("additional_data", {}).get("pagination", {})
-        # is_next_page is set to True or False
-        if not pagination_info.get("more_items_in_collection", False):
+        params["limit"] = tuner.limit
+        page_charge = charge or MemoryCharge(streaming_budget)
+        try:
+            page = _fetch_page(url, headers, params, client, tuner, metrics, cache_ttl, page_charge)
+            # check if next page exists
+            pagination_info = page.get("additional_data", {}).get("pagination", {})
+            # is_next_page is set to True or False
+            more_items = pagination_info.get("more_items_in_collection", False)
+            progress["next_start"] = pagination_info.get("next_start") if more_items else None
+            # yield data only
+            data = page["data"]
+            if data:
+                yield data
+        finally:
+            if charge is None:
+                page_charge.release()
+        if not more_items:
             break
         params["start"] = pagination_info.get("next_start")
 
 
+def _prefetched_paginated_get(
+    url: str,
+    headers: Dict[str, Any],
+    params: Dict[str, Any],
+    concurrency: int,
+    progress: Dict[str, Any],
+    client: requests.Client,
+    tuner: PageSizeTuner,
+    metrics: TResourceMetrics = None,
+    cache_ttl: Optional[float] = None,
+    charge: MemoryCharge = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Speculatively requests the next `concurrency` offset windows in a thread pool and yields
+    pages in offset order. Stops at the first window that is short or reports no more items,
+    windows requested past the end of the collection are discarded.
+
+    No window is requested ahead of the consumer while the streaming memory budget is exhausted, the next
+    window is requested once the one before it was consumed.
+    """
+    next_start = params["start"]
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    # each window is requested with the page size current at submit time
+    windows: Deque[Tuple["Future[Dict[str, Any]]", int, MemoryCharge]] = deque()
+
+    def _submit_windows() -> None:
+        nonlocal next_start
+        while len(windows) < concurrency:
+            if windows and streaming_budget.exhausted:
+                add_metrics(metrics, deferred_requests=1)
+                return
+            limit = tuner.limit
+            window_params = dict(params, start=next_start, limit=limit)
+            window_charge = charge or MemoryCharge(streaming_budget)
+            window = executor.submit(
+                _fetch_page,
+                url,
+                headers,
+                window_params,
+                client,
+                tuner,
+                metrics,
+                cache_ttl,
+                window_charge,
+            )
+            windows.append((window, limit, window_charge))
+            next_start += limit
+
+    try:
+        _submit_windows()
+        while windows:
+            window, limit, window_charge = windows[0]
+            page = window.result()
+            data = page["data"]
+            pagination_info = page.get("additional_data", {}).get("pagination", {})
+            last_window = (
+                not pagination_info.get("more_items_in_collection", False)
+                or not data
+                or len(data) < limit
+            )
+            progress["next_start"] = (
+                None if last_window else pagination_info.get("next_start")
+            )
+            if data:
+                yield data
+            windows.popleft()
+            if charge is None:
+                window_charge.release()
+            if last_window:
+                break
+            _submit_windows()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        # windows discarded past the end or left by an error, requests still running are not charged
+        if charge is None:
+            for _, _, window_charge in windows:
+                window_charge.release()
+
+
+def _fetch_page(
+    url: str,
+    headers: Dict[str, Any],
+    params: Dict[str, Any],
+    client: requests.Client = None,
+    tuner: PageSizeTuner = None,
+    metrics: TResourceMetrics = None,
+    cache_ttl: Optional[float] = None,
+    charge: MemoryCharge = None,
+) -> Dict[str, Any]:
+    """Sends a single request paced by the shared rate limiter, rate limited requests are retried.
+    The size and latency of the page are reported to `tuner` and added to `metrics`, its body is added to
+    `charge` while it is read.
+
+    With a `cache_ttl`, the response is served from and stored in the response cache if it is enabled.
+    """
+    if client is None:
+        client = http_client
+    cache = response_cache() if cache_ttl is not None else None
+    cached = None
+    if cache is not None:
+        cache_key = cache.key(url, headers, params)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if cached.age < cache_ttl:  # type: ignore[operator]
+                add_metrics(metrics, cache_hits=1)
+                if charge is not None:
+                    charge.add(len(cached.body))
+                return decode_content(cached.body)
+            headers = dict(headers, **cached.validators())
+    attempt = 0
+    while True:
+        waiting_since = time.perf_counter()
+        rate_limiter.acquire()
+        # a request holds its slot until the body was read, so MAX_CONCURRENT_REQUESTS bounds open responses
+        with _request_budget:
+            started = time.perf_counter()
+            # the body is read by `decode_response`, large bodies are parsed while streamed
+            response = client.get(url, headers=headers, params=params, stream=True)
+            received = time.perf_counter()
+            # time to headers, reading the body is added once it is decoded
+            add_metrics(
+                metrics,
+                requests=1,
+                throttle_seconds=started - waiting_since,
+                http_seconds=received - started,
+            )
+            rate_limiter.update_from_response(response.status_code, response.headers)
+            if response.status_code == 429 and attempt < RATE_LIMIT_MAX_RETRIES:
+                response.close()
+                attempt += 1
+                add_metrics(metrics, throttle_retries=1)
+                continue
+            response.raise_for_status()
+            if cache is not None:
+                page, size, read_seconds = _cache_response(
+                    cache, cache_key, cached, response, metrics, charge
+                )
+            else:
+                page, size, read_seconds = decode_response(
+                    response, charge.add if charge is not None else None
+                )
+            decoded = time.perf_counter()
+            add_metrics(
+                metrics,
+                bytes=size,
+                http_seconds=read_seconds,
+                decode_seconds=decoded - received - read_seconds,
+            )
+            rows = len(page.get("data") or ())
+            # the fixed cost of a request dominates short pages, only full pages tell the cost of a row
+            if tuner is not None and rows >= params.get("limit", 0):
+                tuner.observe(rows, size, decoded - started)
+            return page
+
+
+def _cache_response(
+    cache: ResponseCache,
+    cache_key: str,
+    cached: Optional[TCachedResponse],
+    response: requests.Response,
+    metrics: TResourceMetrics = None,
+    charge: MemoryCharge = None,
+) -> TDecodedResponse:
+    if response.status_code == 304 and cached is not None:
+        response.close()
+        cache.renew(cache_key)
+        add_metrics(metrics, not_modified=1)
+        if charge is not None:
+            charge.add(len(cached.body))
+        return TDecodedResponse(decode_content(cached.body), len(cached.body), 0.0)
+    started = time.perf_counter()
+    body = response.content
+    read_seconds = time.perf_counter() - started
+    if charge is not None:
+        charge.add(len(body))
+    cache.put(
+        cache_key, body, response.headers.get("etag"), response.headers.get("last-modified")
+    )
+    return TDecodedResponse(decode_content(body), len(body), read_seconds)
+
+
 T = TypeVar("T")
 
 
-def _extract_recents_data(data: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def _extract_recents_data(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Results from recents endpoint contain `data` key which is either a single entity or list of entities
 
-    This returns a flat list of entities from an iterable of recent results
+    This returns a flat list of entities from an iterable of recent results. Pages that are flat already,
+    as all entity endpoint pages are, are returned as they are without a copy.
     """
+    if all(isinstance(item, dict) for item in data):
+        return data
     return [
         data_item
         for data_item in chain.from_iterable(
@@ -98,25 +680,84 @@ def _list_wrapped(item: Union[List[T], T]) -> List[T]:
 
 
 def _get_recent_pages(
-    entity: str, resource_name: str, pipedrive_api_key: str, since_timestamp: str
+    entity: str,
+    resource_name: str,
+    pipedrive_api_key: str,
+    since_timestamp: str,
+    start: Union[int, str] = 0,
+    progress: Dict[str, Any] = None,
+    metrics: TResourceMetrics = None,
+    content_filter: ContentHashFilter = None,
 ) -> Iterator[TDataPage]:
-    custom_fields_mapping = (
-        dlt.current.source_state().get("custom_fields_mapping", {}).get(entity, {})
-    )
+    """Yields transformed pages of an entity, empty pages when `content_filter` dropped all rows"""
+    # wait only for the mapping of this entity, it is refreshed here if `create_state` did not get to it yet
+    if entity in FIELDS_ENTITIES:
+        custom_fields_mapping = compile_fields_mapping(
+            refresh_fields_mapping(entity, pipedrive_api_key)
+        )
+    else:
+        custom_fields_mapping = compile_fields_mapping(
+            dlt.current.source_state().get("custom_fields_mapping", {}).get(entity, {})
+        )
     # print(entity, custom_fields_mapping)
-    pages = get_pages(
-        resource_name,
-        pipedrive_api_key,
-        extra_params=dict(since_timestamp=since_timestamp), # CHANGED: , items=entity
-    )
-    pages = (_extract_recents_data(page) for page in pages)
+    # a checkpoint written under the other api version restarts the pagination
+    pages: Iterator[TDataPage]
+    if api_version(entity) == "v2":
+        pages = get_pages_v2(
+            resource_name,
+            pipedrive_api_key,
+            updated_since=since_timestamp,
+            cursor=start if isinstance(start, str) else None,
+            progress=progress,
+            metrics=metrics,
+        )
+    else:
+        pages = get_pages(
+            resource_name,
+            pipedrive_api_key,
+            extra_params=dict(since_timestamp=since_timestamp), # CHANGED: , items=entity
+            concurrency=PAGINATION_CONCURRENCY.get(entity, 1),
+            start=start if isinstance(start, int) else 0,
+            progress=progress,
+            metrics=metrics,
+        )
+        pages = (_extract_recents_data(page) for page in pages)
 
-    pages_count = 0
-    for page in pages:
-        pages_count += 1
-        yield rename_fields(page, custom_fields_mapping)
+    if entity in ARROW_ENTITIES:
+        from .arrow import page_to_arrow
 
-    print("entity: ", resource_name, "pages count: ", pages_count)
+        def _transform_page(page: TDataPage) -> Any:
+            return page_to_arrow(page, custom_fields_mapping, ARROW_CURSOR_COLUMN)
+
+    else:
+
+        def _transform_page(page: TDataPage) -> Any:
+            return rename_fields(page, custom_fields_mapping)
+
+    # a row with a custom field hash or an option id missing in the mapping forces one refresh of the mapping
+    check_unknown_fields = entity in FIELDS_ENTITIES
+    seen_keys: Set[str] = set()
+    seen_options: Set[Tuple[str, Any]] = set()
+
+    for page in pages:
+        if content_filter is not None:
+            rows_count = len(page)
+            page = content_filter.filter(page)
+            add_metrics(metrics, dropped_rows=rows_count - len(page))
+            if not page:
+                yield page
+                continue
+        if check_unknown_fields and has_unknown_custom_fields(
+            page, custom_fields_mapping, seen_keys, seen_options
+        ):
+            check_unknown_fields = False
+            custom_fields_mapping = compile_fields_mapping(
+                refresh_fields_mapping(entity, pipedrive_api_key, force=True)
+            )
+        with measure(metrics, "transform_seconds"):
+            transformed_page = _transform_page(page)
+        add_metrics(metrics, rows=len(page), pages=1)
+        yield transformed_page
 
 
 __source_name__ = "pipedrive"
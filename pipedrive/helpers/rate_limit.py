@@ -0,0 +1,124 @@
+"""Process-wide token bucket that paces every request sent to the Pipedrive api
+
+Pipedrive enforces burst limits per api token and reports the remaining budget of the current window
+in `x-ratelimit-remaining` and `x-ratelimit-reset` (seconds until the window resets) headers.
+Documentation: https://pipedrive.readme.io/docs/core-api-concepts-rate-limiting
+"""
+
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from ..settings import (
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_MIN_REQUESTS_PER_SECOND,
+    RATE_LIMIT_REQUESTS_PER_SECOND,
+)
+
+
+class TokenBucketRateLimiter:
+    """Token bucket with adaptive refill rate.
+
+    The refill rate follows the budget reported by Pipedrive's rate limit headers and is halved on every
+    429 response, the bucket is then blocked until the window resets. Without headers the rate recovers
+    additively towards `max_rate`.
+    """
+
+    def __init__(self, max_rate: float, burst: float, min_rate: float) -> None:
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.rate = max_rate
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._consecutive_throttles = 0
+        self._lock = threading.Lock()
+        # counters
+        self.requests = 0
+        self.throttled_requests = 0
+        self.throttled_seconds = 0.0
+        self.rate_limited_responses = 0
+
+    def acquire(self) -> float:
+        """Blocks until a request may be sent, returns the number of seconds spent waiting"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                delay = self._blocked_until - now
+                if delay <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.requests += 1
+                        if waited:
+                            self.throttled_requests += 1
+                            self.throttled_seconds += waited
+                        return waited
+                    delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def update_from_response(
+        self, status_code: int, headers: Mapping[str, str]
+    ) -> None:
+        """Adapts the refill rate to the budget reported by the api"""
+        remaining = _header_value(headers, "x-ratelimit-remaining")
+        reset = _header_value(headers, "x-ratelimit-reset")
+        with self._lock:
+            now = time.monotonic()
+            if status_code == 429:
+                self.rate_limited_responses += 1
+                self._consecutive_throttles += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                retry_after = _header_value(headers, "retry-after") or reset
+                if not retry_after:
+                    retry_after = float(2 ** min(self._consecutive_throttles, 6))
+                self._block(now + retry_after)
+                return
+            self._consecutive_throttles = 0
+            if remaining is not None and reset:
+                if remaining <= 0:
+                    self._block(now + reset)
+                else:
+                    self.rate = min(self.max_rate, max(self.min_rate, remaining / reset))
+            else:
+                self.rate = min(self.max_rate, self.rate + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "throttled_requests": self.throttled_requests,
+                "throttled_seconds": self.throttled_seconds,
+                "rate_limited_responses": self.rate_limited_responses,
+                "current_rate": self.rate,
+            }
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def _block(self, until: float) -> None:
+        self._blocked_until = max(self._blocked_until, until)
+        self._tokens = 0
+
+
+def _header_value(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+rate_limiter = TokenBucketRateLimiter(
+    max_rate=RATE_LIMIT_REQUESTS_PER_SECOND,
+    burst=RATE_LIMIT_BURST,
+    min_rate=RATE_LIMIT_MIN_REQUESTS_PER_SECOND,
+)
@@ -0,0 +1,135 @@
+"""Persistent cache of Pipedrive responses of rarely changing endpoints
+
+Responses of endpoints listed in RESPONSE_CACHE_TTLS are kept in a SQLite file at RESPONSE_CACHE_PATH, keyed by
+url, params and api token. A response younger than its ttl is served without a request. An older one is
+revalidated with `If-None-Match` / `If-Modified-Since` when Pipedrive sent an `ETag` or `Last-Modified`
+header with it, a 304 response renews it. Least recently used responses are evicted once the cache grows
+above RESPONSE_CACHE_MAX_BYTES.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+from urllib.parse import urlencode
+
+from ..settings import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_PATH
+
+CACHE_TABLE_SQL = """
+create table if not exists responses (
+    key text primary key,
+    body blob not null,
+    etag text,
+    last_modified text,
+    stored_at real not null,
+    accessed_at real not null,
+    size integer not null
+)
+"""
+
+
+class TCachedResponse(NamedTuple):
+    key: str
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers, empty if the response cannot be revalidated"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    def __init__(self, path: str, max_bytes: int = RESPONSE_CACHE_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("pragma journal_mode=wal")
+        self._connection.execute(CACHE_TABLE_SQL)
+
+    @staticmethod
+    def key(url: str, headers: Dict[str, Any], params: Dict[str, Any]) -> str:
+        """Key of a request, the api token is hashed in so accounts do not share responses"""
+        token = str(headers.get("x-api-token", ""))
+        query = urlencode(sorted((name, str(value)) for name, value in params.items()))
+        return hashlib.sha256(f"{token}\n{url}?{query}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[TCachedResponse]:
+        with self._lock:
+            row = self._connection.execute(
+                "select key, body, etag, last_modified, stored_at from responses where key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "update responses set accessed_at = ? where key = ?", (time.time(), key)
+            )
+        return TCachedResponse(*row)
+
+    def put(self, key: str, body: bytes, etag: Optional[str], last_modified: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "insert or replace into responses values (?, ?, ?, ?, ?, ?, ?)",
+                (key, body, etag, last_modified, now, now, len(body)),
+            )
+            self._evict()
+
+    def renew(self, key: str) -> None:
+        """Marks a response revalidated by a 304 as fresh"""
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "update responses set stored_at = ?, accessed_at = ? where key = ?", (now, now, key)
+            )
+
+    def size(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "select coalesce(sum(size), 0) from responses"
+            ).fetchone()[0]  # type: ignore[no-any-return]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self) -> None:
+        total = self._connection.execute("select coalesce(sum(size), 0) from responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._connection.execute(
+            "select key, size from responses order by accessed_at"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._connection.executemany("delete from responses where key = ?", evicted)
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def response_cache() -> Optional[ResponseCache]:
+    """Process-wide cache at RESPONSE_CACHE_PATH, None if the cache is disabled"""
+    global _cache
+    if RESPONSE_CACHE_PATH is None:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(RESPONSE_CACHE_PATH)
+        return _cache
@@ -1,5 +1,7 @@
 """Pipedrive source settings and constants"""
 
+from typing import Dict, Optional, Set
+
 ENTITY_MAPPINGS = [
     ("activity", "activityFields", {"user_id": 0}),
     ("organization", "organizationFields", None),
@@ -11,6 +13,31 @@ ENTITY_MAPPINGS = [
     ("user", None, None),
 ]
 
+# Seconds the custom fields mapping kept in state is reused before the *Fields endpoints are fetched again.
+# Rows with unknown custom field hashes refresh the mapping of their entity regardless.
+CUSTOM_FIELDS_TTL = 24 * 60 * 60
+
+# Seconds between full refreshes that replace all tables to pick up records deleted in Pipedrive,
+# runs in between merge changed records on `id`. None disables periodic full refreshes.
+FULL_REFRESH_INTERVAL: Optional[int] = 7 * 24 * 60 * 60
+# Cursor end value of full refreshes, an incremental with end value does not read or update the cursor state
+FULL_REFRESH_END_VALUE = "9999-12-31 23:59:59"
+
+# Pipedrive returns at most 500 rows per page
+MAX_PAGE_SIZE = 500
+MIN_PAGE_SIZE = 50
+# Initial page size per endpoint, other endpoints start at MAX_PAGE_SIZE. Sizes are tuned while paginating
+# and the last size of each recents resource is kept in source state for the next run.
+PAGE_SIZES: Dict[str, int] = {"activities": 200, "notes": 200}
+# Page sizes are lowered until a page body is estimated below this many bytes and fetched within this many seconds
+PAGE_TARGET_BYTES = 8 * 1024 * 1024
+PAGE_TARGET_SECONDS = 10.0
+
+# Seconds a resource paginates before it stops and checkpoints its progress, the next run resumes from the
+# checkpoint. Checkpoints are committed with the load package, None disables the budget.
+# Kept below the hourly schedule of the GitHub Action so normalize and load finish before the next run starts
+PAGINATION_TIME_BUDGET: Optional[float] = 40 * 60
+
 RECENTS_ENTITIES = {
     "activity": "activities",
     "activityType": "activity_types",
@@ -27,3 +54,80 @@ RECENTS_ENTITIES = {
     "task": "tasks",
     "user": "users",
 }
+
+# Api version used per entity, "v1" (default) pages /v1/recents by offset, "v2" pages the /api/v2 entity
+# endpoint by cursor filtered with `updated_since`. Only V2_ENTITIES can use "v2". v2 rows reference related
+# objects by id (ie. `org_id` is an integer instead of an object) so their tables differ from v1 tables.
+API_VERSIONS: Dict[str, str] = {}
+V2_ENTITIES = {"activity", "deal", "organization", "person", "product"}
+
+# Number of offset windows requested ahead of the consumer when paginating an
+# entity. Entities not listed here are paginated one page at a time. v2 entities are paged by cursor, one
+# page at a time.
+PAGINATION_CONCURRENCY = {
+    "activity": 4,
+    "deal": 4,
+    "note": 4,
+    "person": 2,
+    "organization": 2,
+}
+
+# Extract all RECENTS_ENTITIES resources in parallel (see `extract.workers` in .dlt/config.toml)
+PARALLEL_EXTRACTION = True
+
+# Maximum number of Pipedrive requests in flight at once, shared by all resources and prefetched windows
+MAX_CONCURRENT_REQUESTS = 8
+
+# Token bucket shared by all Pipedrive requests, the rate adapts to x-ratelimit-* response headers
+RATE_LIMIT_REQUESTS_PER_SECOND = 20.0
+RATE_LIMIT_MIN_REQUESTS_PER_SECOND = 1.0
+RATE_LIMIT_BURST = 40
+# Number of times a request rejected with 429 is retried after the limiter backs off
+RATE_LIMIT_MAX_RETRIES = 5
+
+# Responses with bodies of at least this many bytes are parsed incrementally while they are downloaded,
+# which needs `ijson` (not in the Action requirements): about half the speed of orjson, but a fraction of
+# its peak memory. Meant for very large pages, keep it well above PAGE_TARGET_BYTES. None, the default,
+# parses every body at once with orjson.
+JSON_STREAMING_MIN_BYTES: Optional[int] = None
+
+# SQLite file caching responses of the endpoints in RESPONSE_CACHE_TTLS across runs, ie.
+# ".dlt/pipedrive_responses.sqlite". None disables the cache.
+RESPONSE_CACHE_PATH: Optional[str] = None
+# Least recently used responses are evicted above this many bytes
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Seconds a cached response of an endpoint is used without a request. Older responses are revalidated with a
+# conditional request if Pipedrive sent an ETag or Last-Modified header, otherwise fetched again. Changes made
+# in Pipedrive within the ttl are loaded by the first run after it expires. Only requests without a
+# `since_timestamp` are cached: incremental requests are keyed by their cursor and would never be hit again.
+RESPONSE_CACHE_TTLS: Dict[str, float] = {
+    "activityFields": CUSTOM_FIELDS_TTL,
+    "dealFields": CUSTOM_FIELDS_TTL,
+    "organizationFields": CUSTOM_FIELDS_TTL,
+    "personFields": CUSTOM_FIELDS_TTL,
+    "productFields": CUSTOM_FIELDS_TTL,
+}
+
+# Entities whose rows are dropped before transform when their id was already returned in the run, or when
+# their content hash without CONTENT_HASH_EXCLUDED_FIELDS equals the hash of the version loaded before. Hashes
+# are loaded in a `_content_hash` column of the entity tables and looked up for the ids of every page, full
+# refreshes load all rows and rewrite their hashes.
+CONTENT_HASH_ENTITIES: Set[str] = {"activity", "deal", "note", "organization", "person", "product"}
+CONTENT_HASH_EXCLUDED_FIELDS = {"update_time", "modified"}
+
+# Number of deals whose flow is fetched concurrently by the `deals_flow` transformer
+DEALS_FLOW_CONCURRENCY = 8
+# Flow rows are buffered per deals_flow_* table and yielded in batches of this many rows, across deals
+DEALS_FLOW_BATCH_ROWS = 5000
+
+# Decompressed response body bytes of pages all resources together hold until their consumer resumes.
+# Prefetching resources and the `deals_flow` transformer stop requesting ahead while the limit is reached.
+# None prefetches regardless of memory.
+STREAMING_MEMORY_LIMIT: Optional[int] = 64 * 1024 * 1024
+
+# Entities yielded as arrow tables so dlt uses its arrow normalizer (requires pyarrow). List values,
+# including `set` custom fields, are stored as json columns instead of child tables for these entities.
+# Their incremental cursor is ARROW_CURSOR_COLUMN instead of `update_time|modified`. Columns of custom fields
+# are typed from their field type. "deal" cannot be listed, the `deals_flow` transformer needs dict rows.
+ARROW_ENTITIES: Set[str] = set()
+ARROW_CURSOR_COLUMN = "update_time"
@@ -1,4 +1,15 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, TypedDict, Union
 
 
 TDataPage = List[Dict[str, Any]]
+
+
+class TPaginationCheckpoint(TypedDict):
+    """Progress of an interrupted pagination, resumed by the next run.
+    `next_start` is an offset for v1 endpoints and a cursor for v2 endpoints.
+    """
+
+    since_timestamp: str
+    next_start: Union[int, str]
+    full_refresh: bool
+    updated_at: float
@@ -1,5 +1,43 @@
+from typing import Optional
+
 import dlt
 from pipedrive import pipedrive_source
+from pipedrive.helpers.http import connection_stats, http_client
+from pipedrive.helpers.metrics import timing_report, write_metrics
+from pipedrive.helpers.rate_limit import rate_limiter
+
+# How Supabase tables are kept in sync with pipedrive_data: "row" or "statement" level triggers,
+# or "none" to drop the triggers and sync every load with the set-based post-load job.
+# Triggers are not installed by the load, run add_supabase_triggers() once after changing the mode
+SUPABASE_SYNC_MODE = "row"
+
+# Per-resource metrics written at the end of every load: "json", "openmetrics" or None to skip them.
+# Written to stdout unless METRICS_PATH is set, ie. to a file collected by the node exporter textfile collector
+METRICS_FORMAT: Optional[str] = "json"
+METRICS_PATH: Optional[str] = None
+
+
+def print_timing_report() -> None:
+    """Prints per-resource extraction timings, slowest resource first"""
+    report = timing_report()
+    print(
+        f"extract wall clock: {report['wall_clock']:.1f}s, "
+        f"sum of resources: {report['serial_sum']:.1f}s, "
+        f"speedup: {report['speedup']:.1f}x"
+    )
+    for timing in report["resources"]:
+        print(f"  {timing['resource']}: {timing['elapsed']:.1f}s, {timing['pages']} pages")
+    throttling = rate_limiter.stats()
+    print(
+        f"requests: {throttling['requests']}, "
+        f"throttled: {throttling['throttled_requests']} requests / {throttling['throttled_seconds']:.1f}s, "
+        f"429 responses: {throttling['rate_limited_responses']}"
+    )
+    connections = connection_stats(http_client)
+    print(
+        f"connections opened: {connections['connections']}, "
+        f"reused for {connections['reused_connections']} requests ({connections['reuse_ratio']:.0%})"
+    )
 
 
 def load_pipedrive() -> None:
@@ -11,6 +49,11 @@ def load_pipedrive() -> None:
     load_info = pipeline.run(pipedrive_source())
     print(load_info)
     print(pipeline.last_trace.last_normalize_info)
+    print_timing_report()
+    if METRICS_FORMAT:
+        write_metrics(METRICS_FORMAT, METRICS_PATH)
+    if SUPABASE_SYNC_MODE == "none":
+        sync_supabase(pipeline)
 
 
 def load_selected_data() -> None:
@@ -26,6 +69,11 @@ def load_selected_data() -> None:
             "persons", "organizations", "leads", "notes", "users", "custom_fields_mapping"
         )
     )
+    print_timing_report()
+    if METRICS_FORMAT:
+        write_metrics(METRICS_FORMAT, METRICS_PATH)
+    if SUPABASE_SYNC_MODE == "none":
+        sync_supabase(pipeline)
     # print(load_info)
     # # just to show how to access resources within source
     # pipedrive_data = pipedrive_source().with_resources(
@@ -64,14 +112,25 @@ def load_from_start_date() -> None:
     load_info = pipeline.run([source, activities_source])
     print(load_info)
 
-def add_supabase_triggers() -> None:
+def add_supabase_triggers(mode: str = SUPABASE_SYNC_MODE) -> None:
     # Execute SQL in supabase to add triggers to keep tables in sync
+    # "statement" mode syncs every load with one set-based upsert per table instead of one per row
+    # Run once when SUPABASE_SYNC_MODE changes, "none" drops the triggers the loads rely on in the other modes
     print("Adding Supabase triggers to keep tables in sync...")
     import supabase  # type: ignore
-    supabase.add_triggers()
+    supabase.add_triggers(mode)
     print("Supabase pipedrive triggers added.")
 
 
+def sync_supabase(pipeline: Optional[dlt.Pipeline] = None) -> None:
+    # Sync rows of all loads not synced yet into Supabase tables with set-based upserts, replaces the sync triggers
+    # Triggers must be dropped first with add_supabase_triggers("none"), loads are skipped while they are installed
+    print("Syncing loaded rows into Supabase tables...")
+    import supabase  # type: ignore
+    supabase.sync_pending_loads(pipeline=pipeline)
+    print("Supabase tables synced.")
+
+
 if __name__ == "__main__":
     # run our main example
     # load_pipedrive()
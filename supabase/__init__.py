@@ -1,49 +1,81 @@
-import psycopg2
-import os
-import dotenv
-
-# Load environment variables from .env file
-dotenv.load_dotenv()
-# Get connection parameters from environment variables
-USER = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__USERNAME")
-PASSWORD = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__PASSWORD")
-HOST = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__HOST")
-PORT = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__PORT")
-DBNAME = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__DATABASE")
-CONNECT_TIMEOUT = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__CONNECT_TIMEOUT")
-
-def add_triggers() -> None:
-    """Function to add triggers to Supabase database"""
-
-    # Connect to the database
+from typing import Any, Dict, List, Literal
+
+from .config import (
+    CONNECT_TIMEOUT,
+    DBNAME,
+    HOST,
+    PASSWORD,
+    PORT,
+    ROW_TRIGGERS,
+    STATEMENT_TRIGGERS,
+    USER,
+)
+from .db import connection, install, install_timings
+from .sync import DEAL_TYPES_FUNCTION_SQL, backfill_deal_types, sync_pending_loads
+
+TTriggerMode = Literal["row", "statement", "none"]
+
+
+def add_triggers(mode: TTriggerMode = "row", force: bool = False, pipeline: Any = None) -> None:
+    """Function to add triggers to Supabase database
+
+    Functions and triggers are installed in a single transaction, functions whose SQL did not change since
+    the last install are skipped so it is cheap to run on every scheduled job.
+
+    Args:
+        mode: "row" installs FOR EACH ROW triggers that sync every loaded row with its own statements.
+            "statement" installs FOR EACH STATEMENT triggers that read the loaded rows from transition tables
+            and sync them with one set-based upsert per load, which is much cheaper for full reloads.
+            "none" drops all sync triggers, loads are then synced by `sync_pending_loads` after `pipeline.run`.
+        force: Reinstall functions even if unchanged.
+        pipeline: dlt pipeline whose destination connection is reused, by default a pooled connection is used.
+    """
+
     try:
-        connection = psycopg2.connect(
-            user=USER,
-            password=PASSWORD,
-            host=HOST,
-            port=PORT,
-            dbname=DBNAME
-        )
-        print("Supabase Connection successful!")
-        
-        # Create a cursor to execute SQL queries
-        cursor = connection.cursor()
-
-        add_organizations_triggers(connection, cursor)
-        add_persons_triggers(connection, cursor)      
-        add_deals_triggers(connection, cursor)
-  
-        # Close the cursor and connection
-        cursor.close()
-        connection.close()
-        print("Connection closed.")
+        functions_changed = False
+        with connection(pipeline) as conn:
+            print("Supabase Connection successful!")
+            with conn.cursor() as cursor:
+                if mode == "none":
+                    drop_triggers(cursor, "row", ROW_TRIGGERS)
+                    drop_triggers(cursor, "statement", STATEMENT_TRIGGERS)
+                elif mode == "statement":
+                    drop_triggers(cursor, "row", ROW_TRIGGERS)
+                    functions_changed = add_statement_trigger_functions(cursor, force)
+                    add_organizations_statement_triggers(cursor)
+                    add_persons_statement_triggers(cursor)
+                    add_deals_statement_triggers(cursor)
+                else:
+                    drop_triggers(cursor, "statement", STATEMENT_TRIGGERS)
+                    functions_changed = add_all_new_trigger_functions(cursor, force)
+                    add_organizations_triggers(cursor)
+                    add_persons_triggers(cursor)
+                    add_deals_triggers(cursor)
+
+        # asset and financing types of existing deals are synced once after new functions were installed, outside
+        # of the DDL transaction, calling the per-deal functions from one statement per deal id range
+        if functions_changed:
+            with connection(pipeline) as conn:
+                backfill_deal_types(conn)
+
+        for timing in install_timings():
+            print(f"  {timing['name']}: {'installed' if timing['installed'] else 'unchanged'} in {timing['elapsed']:.2f}s")
 
     except Exception as e:
-        print(f"Failed to connect to Supabase: {e}")
-
-def add_organizations_triggers(connection, cursor):
+        print(f"Failed to add Supabase triggers: {e}")
+        raise
+
+def drop_triggers(cursor, mode: TTriggerMode, triggers: Dict[str, List[str]]):
+    print(f"Dropping {mode} level sync triggers.")
+    install(cursor, f"drop_{mode}_triggers", "".join(
+        f"drop trigger if exists {trigger} on pipedrive_data.{table};\n"
+        for table, table_triggers in triggers.items()
+        for trigger in table_triggers
+    ))
+
+def add_organizations_triggers(cursor):
     print("Adding triggers for any changes on pipedrive's tables organizations.")
-    cursor.execute("""
+    install(cursor, "organizations_triggers", """
          -- For inserts
         drop trigger if exists organizations_insert_trigger on pipedrive_data.organizations;
         CREATE TRIGGER organizations_insert_trigger
@@ -57,12 +89,11 @@ def add_organizations_triggers(connection, cursor):
         FOR EACH ROW EXECUTE FUNCTION sync_organization_update();
     """)
 
-    connection.commit()
     print("Organizations triggers added successfully.")
 
-def add_persons_triggers(connection, cursor):
+def add_persons_triggers(cursor):
     print("Adding triggers for any changes on pipedrive's tables persons.")
-    cursor.execute("""
+    install(cursor, "persons_triggers", """
         -- Insert
         drop trigger if exists contacts_persons_insert_trigger on pipedrive_data.persons;
         CREATE TRIGGER contacts_persons_insert_trigger
@@ -100,22 +131,20 @@ def add_persons_triggers(connection, cursor):
         FOR EACH ROW EXECUTE FUNCTION sync_contact_phone();
     """)
 
-    connection.commit()
     print("Persons triggers added successfully.")
 
-def add_deals_triggers(connection, cursor):
+def add_deals_triggers(cursor):
     print("Adding triggers for any changes on pipedrive's tables deals, deal asset_type, and deal financing_type.")
-    cursor.execute("""
+    install(cursor, "deals_triggers", """
         drop trigger if exists trg_sync_deal on pipedrive_data.deals;
         create trigger trg_sync_deal
         after insert or update on pipedrive_data.deals
         for each row
         execute function trigger_sync_deal();
     """)
-    connection.commit()
     print("Deals triggers added successfully.")
 
-    cursor.execute("""
+    install(cursor, "deal_types_triggers", """
         drop trigger if exists trg_sync_deal_asset_type on pipedrive_data.deals__asset_type;
         create trigger trg_sync_deal_asset_type
         after insert or update or delete on pipedrive_data.deals__asset_type
@@ -127,25 +156,15 @@ def add_deals_triggers(connection, cursor):
         for each row execute function trigger_sync_deal_financing_type();
     """)
 
-    connection.commit()
-
-    # touch all rows in deals__asset_type and deals__financing_type to fire the triggers and sync data
-    cursor.execute("""
-        update pipedrive_data.deals__asset_type set _dlt_id = _dlt_id;
-        update pipedrive_data.deals__financing_type set _dlt_id = _dlt_id;
-    """)
-
-    connection.commit()
-
     print("Deals asset_type & financing_type triggers added successfully.")
 
 
 
 # NEW Trigger functions to keep Supabase tables in sync with Pipedrive data
-def add_all_new_trigger_functions(connection, cursor):
+def add_all_new_trigger_functions(cursor, force: bool = False) -> bool:
     print("Adding all new triggers to keep Supabase tables in sync with Pipedrive data.")
 
-    cursor.execute("""
+    installed = install(cursor, "row_trigger_functions", """
         -- 1) Harden SECURITY DEFINER functions with explicit search_path and qualify names
         -- trigger_sync_deal (public)
         create or replace function public.trigger_sync_deal()
@@ -353,7 +372,373 @@ def add_all_new_trigger_functions(connection, cursor):
         return new;
         end;
         $$;
+    """, skip_unchanged=True, force=force)
+
+    print("All new trigger functions added successfully." if installed else "Trigger functions are up to date.")
+    return installed
+
+
+# Statement level triggers: postgres allows a single event per trigger with transition tables,
+# so inserts, updates and deletes get separate triggers that share one function
+def add_organizations_statement_triggers(cursor):
+    print("Adding statement level triggers for any changes on pipedrive's tables organizations.")
+    install(cursor, "organizations_statement_triggers", """
+        drop trigger if exists organizations_insert_stmt_trigger on pipedrive_data.organizations;
+        create trigger organizations_insert_stmt_trigger
+        after insert on pipedrive_data.organizations
+        referencing new table as new_rows
+        for each statement execute function public.sync_organizations_statement();
+
+        drop trigger if exists organizations_update_stmt_trigger on pipedrive_data.organizations;
+        create trigger organizations_update_stmt_trigger
+        after update on pipedrive_data.organizations
+        referencing new table as new_rows
+        for each statement execute function public.sync_organizations_statement();
+    """)
+
+    print("Organizations statement level triggers added successfully.")
+
+def add_persons_statement_triggers(cursor):
+    print("Adding statement level triggers for any changes on pipedrive's tables persons.")
+    install(cursor, "persons_statement_triggers", """
+        drop trigger if exists contacts_persons_insert_stmt_trigger on pipedrive_data.persons;
+        create trigger contacts_persons_insert_stmt_trigger
+        after insert on pipedrive_data.persons
+        referencing new table as new_rows
+        for each statement execute function public.sync_contacts_statement();
+
+        drop trigger if exists contacts_persons_update_stmt_trigger on pipedrive_data.persons;
+        create trigger contacts_persons_update_stmt_trigger
+        after update on pipedrive_data.persons
+        referencing new table as new_rows
+        for each statement execute function public.sync_contacts_statement();
+
+        drop trigger if exists contacts_email_insert_stmt_trigger on pipedrive_data.persons__email;
+        create trigger contacts_email_insert_stmt_trigger
+        after insert on pipedrive_data.persons__email
+        referencing new table as new_rows
+        for each statement execute function public.sync_contact_emails_statement();
+
+        drop trigger if exists contacts_email_update_stmt_trigger on pipedrive_data.persons__email;
+        create trigger contacts_email_update_stmt_trigger
+        after update on pipedrive_data.persons__email
+        referencing new table as new_rows
+        for each statement execute function public.sync_contact_emails_statement();
+
+        drop trigger if exists contacts_phone_insert_stmt_trigger on pipedrive_data.persons__phone;
+        create trigger contacts_phone_insert_stmt_trigger
+        after insert on pipedrive_data.persons__phone
+        referencing new table as new_rows
+        for each statement execute function public.sync_contact_phones_statement();
+
+        drop trigger if exists contacts_phone_update_stmt_trigger on pipedrive_data.persons__phone;
+        create trigger contacts_phone_update_stmt_trigger
+        after update on pipedrive_data.persons__phone
+        referencing new table as new_rows
+        for each statement execute function public.sync_contact_phones_statement();
     """)
 
-    connection.commit()
-    print("All new trigger functions added successfully.")
\ No newline at end of file
+    print("Persons statement level triggers added successfully.")
+
+def add_deals_statement_triggers(cursor):
+    print("Adding statement level triggers for any changes on pipedrive's tables deals, deal asset_type, and deal financing_type.")
+    install(cursor, "deals_statement_triggers", """
+        drop trigger if exists trg_sync_deals_insert_stmt on pipedrive_data.deals;
+        create trigger trg_sync_deals_insert_stmt
+        after insert on pipedrive_data.deals
+        referencing new table as new_rows
+        for each statement execute function public.trigger_sync_deals_statement();
+
+        drop trigger if exists trg_sync_deals_update_stmt on pipedrive_data.deals;
+        create trigger trg_sync_deals_update_stmt
+        after update on pipedrive_data.deals
+        referencing new table as new_rows
+        for each statement execute function public.trigger_sync_deals_statement();
+    """)
+
+    for table in ("deals__asset_type", "deals__financing_type"):
+        trigger = f"trg_sync_{table.replace('deals__', 'deal_')}"
+        install(cursor, f"{table}_statement_triggers", f"""
+            drop trigger if exists {trigger}_insert_stmt on pipedrive_data.{table};
+            create trigger {trigger}_insert_stmt
+            after insert on pipedrive_data.{table}
+            referencing new table as new_rows
+            for each statement execute function public.trigger_sync_deal_types_statement();
+
+            drop trigger if exists {trigger}_update_stmt on pipedrive_data.{table};
+            create trigger {trigger}_update_stmt
+            after update on pipedrive_data.{table}
+            referencing new table as new_rows
+            for each statement execute function public.trigger_sync_deal_types_statement();
+
+            drop trigger if exists {trigger}_delete_stmt on pipedrive_data.{table};
+            create trigger {trigger}_delete_stmt
+            after delete on pipedrive_data.{table}
+            referencing old table as old_rows
+            for each statement execute function public.trigger_sync_deal_types_statement();
+        """)
+
+    print("Deals statement level triggers added successfully.")
+
+def add_statement_trigger_functions(cursor, force: bool = False) -> bool:
+    print("Adding set-based sync functions for statement level triggers.")
+
+    installed = install(cursor, "statement_trigger_functions", """
+        -- Upserts deals with the given ids, same columns as sync_deal_from_pipedrive
+        create or replace function public.sync_deals_from_pipedrive(p_deal_ids bigint[])
+        returns void
+        language plpgsql
+        security invoker
+        set search_path to public, pipedrive_data, extensions
+        as $$
+        begin
+        insert into public.deals (
+            id, title, value, currency, stage, status, probability, organization_id, primary_contact_id,
+            owner_user_id, financing_type, deal_assist_user, capital_advisor_fee, referral_fee,
+            referral_partner_id, winning_capital_provider_id, occupancy, ground_lease, property_address,
+            asset_type, investment_strategy, tenancy, hotel_flag_id, hotel_type, single_tenant_name_id,
+            guarantor_type, sponsor_location, experience_level, net_worth, liquidity, assets_under_management,
+            credit_score, us_citizenship, deal_file_folder_link, offering_memorandum_link, add_time, won_time,
+            lost_time, close_time, expected_close_date, last_synced_at, created_at, updated_at
+        )
+        select distinct on (d.id)
+            d.id,
+            d.title,
+            d.value,
+            d.currency,
+            d.stage_id,
+            d.status,
+            null as probability,
+            org.id as organization_id,
+            c.id as primary_contact_id,
+            d.user_id__id as owner_user_id,
+            '{}'::text[] as financing_type, -- populated by sync_deal_types_from_pipedrive after upsert
+            d.deal_assist__id,
+            d.capital_advisor_fee,
+            d.referral_fee,
+            ref.id as referral_partner_id,
+            win_org.id as winning_capital_provider_id,
+            d.occupancy,
+            d.ground_lease,
+            d.full_combined_address_of_property_address as property_address,
+            '{}'::text[] as asset_type, -- populated by sync_deal_types_from_pipedrive after upsert
+            d.investment_strategy,
+            d.tenancy,
+            hotel_org.id as hotel_flag_id,
+            d.hotel_type,
+            tenant_org.id as single_tenant_name_id,
+            d.guarantor_type,
+            d.full_combined_address_of_sponsor_location as sponsor_location,
+            d.experience_level,
+            d.net_worth,
+            d.liquidity,
+            null as assets_under_management,
+            d.credit_score,
+            d.us_citizenship,
+            d.deal_file_folder_link,
+            d.offering_memorandum_link,
+            d.add_time,
+            d.won_time,
+            d.lost_time,
+            d.close_time,
+            d.expected_close_date::date,
+            now() as last_synced_at,
+            now() as created_at,
+            now() as updated_at
+        from pipedrive_data.deals d
+        left join public.organizations org
+            on org.pipedrive_id = d.org_id__value and org.pipedrive_id is not null
+        left join public.contacts c
+            on c.pipedrive_id = d.person_id__value and c.pipedrive_id is not null
+        left join public.contacts ref
+            on ref.pipedrive_id = d.referral_partner__value and ref.pipedrive_id is not null
+        left join public.organizations win_org
+            on win_org.pipedrive_id = d.winning_capital_provider__value and win_org.pipedrive_id is not null
+        left join public.organizations hotel_org
+            on hotel_org.pipedrive_id = d.hotel_flag__value and hotel_org.pipedrive_id is not null
+        left join public.organizations tenant_org
+            on tenant_org.pipedrive_id = d.single_tenant_name__value and tenant_org.pipedrive_id is not null
+        where d.id = any(p_deal_ids)
+        order by d.id, d._dlt_load_id desc
+        on conflict (id) do update set
+            title = excluded.title,
+            value = excluded.value,
+            currency = excluded.currency,
+            stage = excluded.stage,
+            status = excluded.status,
+            probability = excluded.probability,
+            organization_id = excluded.organization_id,
+            primary_contact_id = excluded.primary_contact_id,
+            owner_user_id = excluded.owner_user_id,
+            -- financing_type is maintained by sync_deal_types_from_pipedrive; do not overwrite here
+            deal_assist_user = excluded.deal_assist_user,
+            capital_advisor_fee = excluded.capital_advisor_fee,
+            referral_fee = excluded.referral_fee,
+            referral_partner_id = excluded.referral_partner_id,
+            winning_capital_provider_id = excluded.winning_capital_provider_id,
+            occupancy = excluded.occupancy,
+            ground_lease = excluded.ground_lease,
+            property_address = excluded.property_address,
+            -- asset_type is maintained by sync_deal_types_from_pipedrive; do not overwrite here
+            investment_strategy = excluded.investment_strategy,
+            tenancy = excluded.tenancy,
+            hotel_flag_id = excluded.hotel_flag_id,
+            hotel_type = excluded.hotel_type,
+            single_tenant_name_id = excluded.single_tenant_name_id,
+            guarantor_type = excluded.guarantor_type,
+            sponsor_location = excluded.sponsor_location,
+            experience_level = excluded.experience_level,
+            net_worth = excluded.net_worth,
+            liquidity = excluded.liquidity,
+            assets_under_management = excluded.assets_under_management,
+            credit_score = excluded.credit_score,
+            us_citizenship = excluded.us_citizenship,
+            deal_file_folder_link = excluded.deal_file_folder_link,
+            offering_memorandum_link = excluded.offering_memorandum_link,
+            add_time = excluded.add_time,
+            won_time = excluded.won_time,
+            lost_time = excluded.lost_time,
+            close_time = excluded.close_time,
+            expected_close_date = excluded.expected_close_date,
+            last_synced_at = excluded.last_synced_at,
+            updated_at = excluded.updated_at;
+
+        perform public.sync_deal_types_from_pipedrive(p_deal_ids);
+        end;
+        $$;
+
+        create or replace function public.trigger_sync_deals_statement()
+        returns trigger
+        language plpgsql
+        security definer
+        set search_path to public, pipedrive_data, extensions
+        as $$
+        begin
+        perform public.sync_deals_from_pipedrive(array(select distinct id from new_rows));
+        return null;
+        end;
+        $$;
+
+        create or replace function public.trigger_sync_deal_types_statement()
+        returns trigger
+        language plpgsql
+        security definer
+        set search_path to public, pipedrive_data, extensions
+        as $$
+        declare
+        v_deal_ids bigint[];
+        begin
+        if tg_op = 'DELETE' then
+            select array_agg(distinct d.id) into v_deal_ids
+            from old_rows r
+            join pipedrive_data.deals d on d._dlt_id = r._dlt_parent_id;
+        else
+            select array_agg(distinct d.id) into v_deal_ids
+            from new_rows r
+            join pipedrive_data.deals d on d._dlt_id = r._dlt_parent_id;
+        end if;
+
+        if v_deal_ids is not null then
+            perform public.sync_deal_types_from_pipedrive(v_deal_ids);
+        end if;
+        return null;
+        end;
+        $$;
+
+        create or replace function public.sync_organizations_statement()
+        returns trigger
+        language plpgsql
+        security definer
+        set search_path to public, pipedrive_data, extensions
+        as $$
+        begin
+        insert into public.organizations (pipedrive_id, name, hq_location)
+        select distinct on (o.id) o.id, o.name, o.address
+        from new_rows o
+        order by o.id
+        on conflict (pipedrive_id) do update
+            set name = excluded.name,
+                hq_location = excluded.hq_location
+            where (organizations.name, organizations.hq_location)
+                is distinct from (excluded.name, excluded.hq_location);
+        return null;
+        end;
+        $$;
+
+        create or replace function public.sync_contacts_statement()
+        returns trigger
+        language plpgsql
+        security definer
+        set search_path to public, pipedrive_data, extensions
+        as $$
+        begin
+        insert into public.contacts (pipedrive_id, name, title, location, linkedin, email, organization_id)
+        select distinct on (p.id)
+            p.id,
+            p.name,
+            p.job_title,
+            p.person_address,
+            p.linked_in,
+            p.primary_email,
+            org.id
+        from new_rows p
+        left join public.organizations org on org.pipedrive_id = p.org_id__value
+        order by p.id
+        on conflict (pipedrive_id) do update
+            set name = excluded.name,
+                title = excluded.title,
+                location = excluded.location,
+                linkedin = excluded.linkedin,
+                email = excluded.email,
+                organization_id = excluded.organization_id
+            where (contacts.name, contacts.title, contacts.location, contacts.linkedin, contacts.email, contacts.organization_id)
+                is distinct from (excluded.name, excluded.title, excluded.location, excluded.linkedin, excluded.email, excluded.organization_id);
+        return null;
+        end;
+        $$;
+
+        create or replace function public.sync_contact_emails_statement()
+        returns trigger
+        language plpgsql
+        security definer
+        set search_path to public, pipedrive_data, extensions
+        as $$
+        begin
+        update public.contacts c
+        set email = e.value
+        from new_rows e
+        join pipedrive_data.persons p on p._dlt_id = e._dlt_parent_id
+        where e."primary" is true
+            and c.pipedrive_id = p.id
+            and c.email is distinct from e.value;
+        return null;
+        end;
+        $$;
+
+        create or replace function public.sync_contact_phones_statement()
+        returns trigger
+        language plpgsql
+        security definer
+        set search_path to public, pipedrive_data, extensions
+        as $$
+        begin
+        update public.contacts c
+        set phone = ph.value
+        from new_rows ph
+        join pipedrive_data.persons p on p._dlt_id = ph._dlt_parent_id
+        where ph."primary" is true
+            and c.pipedrive_id = p.id
+            and c.phone is distinct from ph.value;
+        return null;
+        end;
+        $$;
+    """, skip_unchanged=True, force=force)
+    # set-based asset and financing types sync, shared with the post-load sync and the backfill
+    deal_types_installed = install(
+        cursor, "deal_types_statement_function", DEAL_TYPES_FUNCTION_SQL, skip_unchanged=True, force=force
+    )
+    installed = installed or deal_types_installed
+
+    print("Statement level sync functions added successfully." if installed else "Statement level sync functions are up to date.")
+    return installed
+
@@ -0,0 +1,44 @@
+"""Connection settings and sync trigger names of the supabase module"""
+
+import os
+from typing import Dict, List
+
+import dotenv
+
+# Load environment variables from .env file
+dotenv.load_dotenv()
+# Get connection parameters from environment variables
+USER = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__USERNAME")
+PASSWORD = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__PASSWORD")
+HOST = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__HOST")
+PORT = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__PORT")
+DBNAME = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__DATABASE")
+CONNECT_TIMEOUT = os.getenv("DESTINATION__POSTGRES__CREDENTIALS__CONNECT_TIMEOUT")
+
+# Triggers installed by each mode, per pipedrive_data table. Installing a mode drops the triggers of the other one.
+ROW_TRIGGERS: Dict[str, List[str]] = {
+    "organizations": ["organizations_insert_trigger", "organizations_update_trigger"],
+    "persons": ["contacts_persons_insert_trigger", "contacts_persons_update_trigger"],
+    "persons__email": ["contacts_email_insert_trigger", "contacts_email_update_trigger"],
+    "persons__phone": ["contacts_phone_insert_trigger", "contacts_phone_update_trigger"],
+    "deals": ["trg_sync_deal"],
+    "deals__asset_type": ["trg_sync_deal_asset_type"],
+    "deals__financing_type": ["trg_sync_deal_financing_type"],
+}
+STATEMENT_TRIGGERS: Dict[str, List[str]] = {
+    "organizations": ["organizations_insert_stmt_trigger", "organizations_update_stmt_trigger"],
+    "persons": ["contacts_persons_insert_stmt_trigger", "contacts_persons_update_stmt_trigger"],
+    "persons__email": ["contacts_email_insert_stmt_trigger", "contacts_email_update_stmt_trigger"],
+    "persons__phone": ["contacts_phone_insert_stmt_trigger", "contacts_phone_update_stmt_trigger"],
+    "deals": ["trg_sync_deals_insert_stmt", "trg_sync_deals_update_stmt"],
+    "deals__asset_type": [
+        "trg_sync_deal_asset_type_insert_stmt",
+        "trg_sync_deal_asset_type_update_stmt",
+        "trg_sync_deal_asset_type_delete_stmt",
+    ],
+    "deals__financing_type": [
+        "trg_sync_deal_financing_type_insert_stmt",
+        "trg_sync_deal_financing_type_update_stmt",
+        "trg_sync_deal_financing_type_delete_stmt",
+    ],
+}
@@ -0,0 +1,139 @@
+"""Database layer of the supabase module: pooled connections and idempotent, timed DDL installs
+
+Installs of a `connection()` block run in a single transaction. Function installs are skipped when the
+sha256 of their SQL matches the hash recorded by the previous install in `pipedrive_data._supabase_installs`,
+so trigger maintenance is cheap enough to run on every scheduled job.
+"""
+
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, TypedDict
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from .config import CONNECT_TIMEOUT, DBNAME, HOST, PASSWORD, PORT, USER
+
+POOL_MAX_CONNECTIONS = 4
+
+INSTALLS_TABLE_SQL = """
+create table if not exists pipedrive_data._supabase_installs (
+    name text primary key,
+    body_hash text not null,
+    installed_at timestamptz not null default now(),
+    elapsed double precision not null
+);
+"""
+
+
+class TInstallTiming(TypedDict):
+    name: str
+    installed: bool
+    elapsed: float
+
+
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+_install_timings: List[TInstallTiming] = []
+
+
+def get_pool() -> ThreadedConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = ThreadedConnectionPool(
+                1,
+                POOL_MAX_CONNECTIONS,
+                user=USER,
+                password=PASSWORD,
+                host=HOST,
+                port=PORT,
+                dbname=DBNAME,
+                connect_timeout=CONNECT_TIMEOUT,
+            )
+        return _pool
+
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+@contextmanager
+def connection(pipeline: Any = None) -> Iterator[Any]:
+    """Yields a psycopg2 connection in a transaction that is committed on exit and rolled back on error.
+
+    Connections are borrowed from a process-wide pool. When a dlt `pipeline` with a postgres destination is
+    passed, the connection of its sql client is reused instead.
+    """
+    if pipeline is not None:
+        with pipeline.sql_client() as client:
+            native_connection = client.native_connection
+            autocommit = native_connection.autocommit
+            native_connection.autocommit = False
+            try:
+                with native_connection:
+                    yield native_connection
+            finally:
+                native_connection.autocommit = autocommit
+        return
+
+    pool = get_pool()
+    pooled_connection = pool.getconn()
+    try:
+        with pooled_connection:
+            yield pooled_connection
+    finally:
+        pool.putconn(pooled_connection)
+
+
+def install(cursor: Any, name: str, sql: str, skip_unchanged: bool = False, force: bool = False) -> bool:
+    """Executes idempotent DDL in the current transaction and records its timing.
+
+    With `skip_unchanged`, the SQL is not executed when its hash matches the previous install of `name`.
+    Returns True if the SQL was executed.
+    """
+    started = time.perf_counter()
+    body_hash = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+    if skip_unchanged and not force:
+        cursor.execute(INSTALLS_TABLE_SQL)
+        cursor.execute(
+            "select body_hash from pipedrive_data._supabase_installs where name = %s", (name,)
+        )
+        row = cursor.fetchone()
+        if row is not None and row[0] == body_hash:
+            _record_timing(name, False, time.perf_counter() - started)
+            return False
+
+    cursor.execute(sql)
+    elapsed = time.perf_counter() - started
+    if skip_unchanged:
+        cursor.execute(INSTALLS_TABLE_SQL)
+        cursor.execute(
+            """
+            insert into pipedrive_data._supabase_installs (name, body_hash, installed_at, elapsed)
+            values (%s, %s, now(), %s)
+            on conflict (name) do update
+                set body_hash = excluded.body_hash,
+                    installed_at = excluded.installed_at,
+                    elapsed = excluded.elapsed
+            """,
+            (name, body_hash, elapsed),
+        )
+    _record_timing(name, True, elapsed)
+    return True
+
+
+def install_timings() -> List[TInstallTiming]:
+    """Returns timings of installs in this process, in install order"""
+    with _pool_lock:
+        return list(_install_timings)
+
+
+def _record_timing(name: str, installed: bool, elapsed: float) -> None:
+    with _pool_lock:
+        _install_timings.append(TInstallTiming(name=name, installed=installed, elapsed=elapsed))
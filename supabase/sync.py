@@ -0,0 +1,398 @@
+"""Set-based sync of dlt loads into Supabase tables, an alternative to the sync triggers
+
+Rows of a load are found by the `_dlt_load_id` column of the pipedrive_data root tables, child tables
+(`deals__asset_type`, `persons__email`...) are joined through `_dlt_parent_id`. Every completed load after the
+last synced one, recorded in `pipedrive_data._supabase_sync`, is synced, so a load whose sync failed is synced
+by the next job. All steps and the watermark update run in a single transaction, so public tables never see a
+partially synced load. While sync triggers are installed the job only advances the watermark, drop them with
+`add_triggers("none")` to use it.
+"""
+
+import time
+from typing import Any, List, Tuple, TypedDict
+
+from .config import ROW_TRIGGERS, STATEMENT_TRIGGERS
+from .db import connection
+
+
+class TSyncReport(TypedDict):
+    table: str
+    step: str
+    rows: int
+    elapsed: float
+
+
+ORGANIZATIONS_SQL = """
+insert into public.organizations (pipedrive_id, name, hq_location)
+select distinct on (o.id) o.id, o.name, o.address
+from pipedrive_data.organizations o
+where o._dlt_load_id = any(%(load_ids)s)
+order by o.id
+on conflict (pipedrive_id) do update
+    set name = excluded.name,
+        hq_location = excluded.hq_location
+    where (organizations.name, organizations.hq_location)
+        is distinct from (excluded.name, excluded.hq_location);
+"""
+
+CONTACTS_SQL = """
+insert into public.contacts (pipedrive_id, name, title, location, linkedin, email, organization_id)
+select distinct on (p.id)
+    p.id,
+    p.name,
+    p.job_title,
+    p.person_address,
+    p.linked_in,
+    p.primary_email,
+    org.id
+from pipedrive_data.persons p
+left join public.organizations org on org.pipedrive_id = p.org_id__value
+where p._dlt_load_id = any(%(load_ids)s)
+order by p.id
+on conflict (pipedrive_id) do update
+    set name = excluded.name,
+        title = excluded.title,
+        location = excluded.location,
+        linkedin = excluded.linkedin,
+        email = excluded.email,
+        organization_id = excluded.organization_id
+    where (contacts.name, contacts.title, contacts.location, contacts.linkedin, contacts.email, contacts.organization_id)
+        is distinct from (excluded.name, excluded.title, excluded.location, excluded.linkedin, excluded.email, excluded.organization_id);
+"""
+
+CONTACT_CHILD_SQL = """
+update public.contacts c
+set {column} = v.value
+from pipedrive_data.persons p
+join pipedrive_data.persons__{column} v on v._dlt_parent_id = p._dlt_id and v."primary" is true
+where p._dlt_load_id = any(%(load_ids)s)
+    and c.pipedrive_id = p.id
+    and c.{column} is distinct from v.value;
+"""
+
+DEALS_SQL = """
+insert into public.deals (
+    id, title, value, currency, stage, status, probability, organization_id, primary_contact_id,
+    owner_user_id, financing_type, deal_assist_user, capital_advisor_fee, referral_fee,
+    referral_partner_id, winning_capital_provider_id, occupancy, ground_lease, property_address,
+    asset_type, investment_strategy, tenancy, hotel_flag_id, hotel_type, single_tenant_name_id,
+    guarantor_type, sponsor_location, experience_level, net_worth, liquidity, assets_under_management,
+    credit_score, us_citizenship, deal_file_folder_link, offering_memorandum_link, add_time, won_time,
+    lost_time, close_time, expected_close_date, last_synced_at, created_at, updated_at
+)
+select distinct on (d.id)
+    d.id,
+    d.title,
+    d.value,
+    d.currency,
+    d.stage_id,
+    d.status,
+    null as probability,
+    org.id as organization_id,
+    c.id as primary_contact_id,
+    d.user_id__id as owner_user_id,
+    '{}'::text[] as financing_type, -- synced by the deal types steps
+    d.deal_assist__id,
+    d.capital_advisor_fee,
+    d.referral_fee,
+    ref.id as referral_partner_id,
+    win_org.id as winning_capital_provider_id,
+    d.occupancy,
+    d.ground_lease,
+    d.full_combined_address_of_property_address as property_address,
+    '{}'::text[] as asset_type, -- synced by the deal types steps
+    d.investment_strategy,
+    d.tenancy,
+    hotel_org.id as hotel_flag_id,
+    d.hotel_type,
+    tenant_org.id as single_tenant_name_id,
+    d.guarantor_type,
+    d.full_combined_address_of_sponsor_location as sponsor_location,
+    d.experience_level,
+    d.net_worth,
+    d.liquidity,
+    null as assets_under_management,
+    d.credit_score,
+    d.us_citizenship,
+    d.deal_file_folder_link,
+    d.offering_memorandum_link,
+    d.add_time,
+    d.won_time,
+    d.lost_time,
+    d.close_time,
+    d.expected_close_date::date,
+    now() as last_synced_at,
+    now() as created_at,
+    now() as updated_at
+from pipedrive_data.deals d
+left join public.organizations org
+    on org.pipedrive_id = d.org_id__value and org.pipedrive_id is not null
+left join public.contacts c
+    on c.pipedrive_id = d.person_id__value and c.pipedrive_id is not null
+left join public.contacts ref
+    on ref.pipedrive_id = d.referral_partner__value and ref.pipedrive_id is not null
+left join public.organizations win_org
+    on win_org.pipedrive_id = d.winning_capital_provider__value and win_org.pipedrive_id is not null
+left join public.organizations hotel_org
+    on hotel_org.pipedrive_id = d.hotel_flag__value and hotel_org.pipedrive_id is not null
+left join public.organizations tenant_org
+    on tenant_org.pipedrive_id = d.single_tenant_name__value and tenant_org.pipedrive_id is not null
+where d._dlt_load_id = any(%(load_ids)s)
+order by d.id, d._dlt_load_id desc
+on conflict (id) do update set
+    title = excluded.title,
+    value = excluded.value,
+    currency = excluded.currency,
+    stage = excluded.stage,
+    status = excluded.status,
+    probability = excluded.probability,
+    organization_id = excluded.organization_id,
+    primary_contact_id = excluded.primary_contact_id,
+    owner_user_id = excluded.owner_user_id,
+    -- financing_type and asset_type are synced by the deal types steps; do not overwrite here
+    deal_assist_user = excluded.deal_assist_user,
+    capital_advisor_fee = excluded.capital_advisor_fee,
+    referral_fee = excluded.referral_fee,
+    referral_partner_id = excluded.referral_partner_id,
+    winning_capital_provider_id = excluded.winning_capital_provider_id,
+    occupancy = excluded.occupancy,
+    ground_lease = excluded.ground_lease,
+    property_address = excluded.property_address,
+    investment_strategy = excluded.investment_strategy,
+    tenancy = excluded.tenancy,
+    hotel_flag_id = excluded.hotel_flag_id,
+    hotel_type = excluded.hotel_type,
+    single_tenant_name_id = excluded.single_tenant_name_id,
+    guarantor_type = excluded.guarantor_type,
+    sponsor_location = excluded.sponsor_location,
+    experience_level = excluded.experience_level,
+    net_worth = excluded.net_worth,
+    liquidity = excluded.liquidity,
+    assets_under_management = excluded.assets_under_management,
+    credit_score = excluded.credit_score,
+    us_citizenship = excluded.us_citizenship,
+    deal_file_folder_link = excluded.deal_file_folder_link,
+    offering_memorandum_link = excluded.offering_memorandum_link,
+    add_time = excluded.add_time,
+    won_time = excluded.won_time,
+    lost_time = excluded.lost_time,
+    close_time = excluded.close_time,
+    expected_close_date = excluded.expected_close_date,
+    last_synced_at = excluded.last_synced_at,
+    updated_at = excluded.updated_at;
+"""
+
+# asset and financing types keep the semantics of the row level triggers: the existing per-deal functions
+# are called for every selected deal from one statement instead of one trigger invocation per child row
+DEAL_TYPES_SQL = """
+{statement} public.{function}(t.id)
+from (
+    select distinct pd.id
+    from pipedrive_data.deals pd
+    where {deals_filter}
+    order by pd.id
+) t;
+"""
+
+# (public table, function, sql) syncing asset and financing types of the deals matched by `{deals_filter}`,
+# shared by the post-load sync, the backfill and the statement level trigger function. `{statement}` is
+# `select`, or `perform` inside plpgsql
+DEAL_TYPES_STEPS: List[Tuple[str, str, str]] = [
+    ("deal_asset_types", "map_all_deal_asset_types_for_deal", DEAL_TYPES_SQL),
+    ("deals", "sync_deal_asset_type", DEAL_TYPES_SQL),
+    ("deals", "sync_deal_financing_type", DEAL_TYPES_SQL),
+]
+
+DEALS_ID_RANGE_SQL = "select min(id), max(id), count(*) from pipedrive_data.deals;"
+
+LOADED_DEALS_FILTER = "pd._dlt_load_id = any(%(load_ids)s)"
+DEALS_CHUNK_FILTER = "pd.id between %(first_id)s and %(last_id)s"
+
+SYNC_STATE_TABLE_SQL = """
+create table if not exists pipedrive_data._supabase_sync (
+    schema_name text primary key,
+    last_load_id text not null,
+    last_inserted_at timestamptz not null,
+    synced_at timestamptz not null default now()
+);
+"""
+
+# serializes concurrent sync jobs for the whole transaction, including the first one when no watermark exists
+SYNC_LOCK_SQL = "select pg_advisory_xact_lock(hashtext('pipedrive_data._supabase_sync'));"
+
+LAST_SYNCED_LOAD_SQL = """
+select last_load_id, last_inserted_at
+from pipedrive_data._supabase_sync
+where schema_name = %(schema_name)s;
+"""
+
+PENDING_LOADS_SQL = """
+select load_id, inserted_at
+from pipedrive_data._dlt_loads
+where status = 0 and schema_name = %(schema_name)s
+    and (
+        %(last_inserted_at)s::timestamptz is null
+        or (inserted_at, load_id) > (%(last_inserted_at)s::timestamptz, %(last_load_id)s::text)
+    )
+order by inserted_at, load_id;
+"""
+
+SAVE_SYNCED_LOAD_SQL = """
+insert into pipedrive_data._supabase_sync (schema_name, last_load_id, last_inserted_at, synced_at)
+values (%(schema_name)s, %(last_load_id)s, %(last_inserted_at)s, now())
+on conflict (schema_name) do update
+    set last_load_id = excluded.last_load_id,
+        last_inserted_at = excluded.last_inserted_at,
+        synced_at = excluded.synced_at;
+"""
+
+INSTALLED_TRIGGERS_SQL = """
+select t.tgname
+from pg_trigger t
+join pg_class c on c.oid = t.tgrelid
+join pg_namespace n on n.oid = c.relnamespace
+where n.nspname = 'pipedrive_data' and not t.tgisinternal and t.tgname = any(%(triggers)s);
+"""
+
+# (public table, step, sql) in dependency order: contacts and deals look up organizations and contacts
+SYNC_STEPS: List[Tuple[str, str, str]] = [
+    ("organizations", "upsert", ORGANIZATIONS_SQL),
+    ("contacts", "upsert", CONTACTS_SQL),
+    ("contacts", "email", CONTACT_CHILD_SQL.format(column="email")),
+    ("contacts", "phone", CONTACT_CHILD_SQL.format(column="phone")),
+    ("deals", "upsert", DEALS_SQL),
+] + [
+    (table, function, sql.format(statement="select", function=function, deals_filter=LOADED_DEALS_FILTER))
+    for table, function, sql in DEAL_TYPES_STEPS
+]
+
+BACKFILL_STEPS: List[str] = [
+    sql.format(statement="select", function=function, deals_filter=DEALS_CHUNK_FILTER)
+    for _, function, sql in DEAL_TYPES_STEPS
+]
+
+# installed by statement mode, called by its triggers with the ids of the deals a statement touched
+DEAL_TYPES_FUNCTION_SQL = (
+    """
+create or replace function public.sync_deal_types_from_pipedrive(p_deal_ids bigint[])
+returns void
+language plpgsql
+security invoker
+set search_path to public, pipedrive_data, extensions
+as $$
+begin
+"""
+    + "".join(
+        sql.format(statement="perform", function=function, deals_filter="pd.id = any(p_deal_ids)")
+        for _, function, sql in DEAL_TYPES_STEPS
+    )
+    + """end;
+$$;
+"""
+)
+
+
+def sync_pending_loads(schema_name: str = "pipedrive", pipeline: Any = None) -> List[TSyncReport]:
+    """Syncs rows of every completed load not synced yet into public.organizations, public.contacts and
+    public.deals
+
+    The first job syncs all completed loads of `schema_name`. While row or statement level sync triggers are
+    installed the loads were synced by the triggers, their watermark is advanced without running the steps.
+
+    Args:
+        schema_name: dlt schema of the Pipedrive source.
+        pipeline: dlt pipeline whose destination connection is reused, by default a pooled connection is used.
+
+    Returns rows touched and seconds spent per step, the transaction is rolled back if any step fails.
+    """
+    reports: List[TSyncReport] = []
+    with connection(pipeline) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(SYNC_STATE_TABLE_SQL)
+            cursor.execute(SYNC_LOCK_SQL)
+            cursor.execute(LAST_SYNCED_LOAD_SQL, {"schema_name": schema_name})
+            last_load_id, last_inserted_at = cursor.fetchone() or (None, None)
+            cursor.execute(
+                PENDING_LOADS_SQL,
+                {
+                    "schema_name": schema_name,
+                    "last_load_id": last_load_id,
+                    "last_inserted_at": last_inserted_at,
+                },
+            )
+            pending_loads = cursor.fetchall()
+            if not pending_loads:
+                print("No completed loads to sync.")
+                return reports
+            sync_triggers = [
+                trigger
+                for triggers in (*ROW_TRIGGERS.values(), *STATEMENT_TRIGGERS.values())
+                for trigger in triggers
+            ]
+            cursor.execute(INSTALLED_TRIGGERS_SQL, {"triggers": sync_triggers})
+            installed_triggers = [row[0] for row in cursor.fetchall()]
+            if installed_triggers:
+                print(
+                    f"Sync triggers are installed ({', '.join(sorted(installed_triggers))}), "
+                    f"{len(pending_loads)} loads were synced by them."
+                )
+            else:
+                params = {"load_ids": [load_id for load_id, _ in pending_loads]}
+                for table, step, sql in SYNC_STEPS:
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    reports.append(
+                        TSyncReport(
+                            table=table,
+                            step=step,
+                            rows=max(cursor.rowcount, 0),
+                            elapsed=time.perf_counter() - started,
+                        )
+                    )
+            last_load_id, last_inserted_at = pending_loads[-1]
+            cursor.execute(
+                SAVE_SYNCED_LOAD_SQL,
+                {
+                    "schema_name": schema_name,
+                    "last_load_id": last_load_id,
+                    "last_inserted_at": last_inserted_at,
+                },
+            )
+    if reports:
+        print(f"Synced {len(pending_loads)} loads up to {last_load_id}:")
+    for report in reports:
+        print(
+            f"  public.{report['table']} {report['step']}: "
+            f"{report['rows']} rows in {report['elapsed']:.2f}s"
+        )
+    return reports
+
+
+def backfill_deal_types(conn: Any, chunk_size: int = 5000) -> int:
+    """Syncs asset_type and financing_type of all deals over deal id ranges, with one statement per step and
+    range calling the per-deal functions of the row level triggers
+
+    Every chunk of `chunk_size` ids is committed on its own so locks on public.deals stay short.
+    Returns the number of deals synced.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(DEALS_ID_RANGE_SQL)
+        min_id, max_id, deals_count = cursor.fetchone()
+        if not deals_count:
+            return 0
+        synced = 0
+        started = time.perf_counter()
+        for first_id in range(min_id, max_id + 1, chunk_size):
+            last_id = min(first_id + chunk_size - 1, max_id)
+            params = {"first_id": first_id, "last_id": last_id}
+            for sql in BACKFILL_STEPS:
+                cursor.execute(sql, params)
+            # every step calls its function once per deal of the chunk
+            synced += max(cursor.rowcount, 0)
+            conn.commit()
+            print(
+                f"  deal types backfill: ids up to {last_id} of {max_id} "
+                f"({(last_id - min_id + 1) / (max_id - min_id + 1):.0%}), "
+                f"{synced} deals synced, {time.perf_counter() - started:.1f}s"
+            )
+    return synced
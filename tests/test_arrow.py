@@ -0,0 +1,63 @@
+from typing import Any, Dict, List
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from dlt.common.normalizers.naming.snake_case import NamingConvention
+
+from pipedrive.helpers.arrow import page_to_arrow
+from pipedrive.helpers.custom_fields_munger import compile_fields_mapping, rename_fields
+
+PARTNER_HASH = "5a1b2c3d4e5f60718293a4b5c6d7e8f901234567"
+SOURCE_HASH = "0f1e2d3c4b5a69788796a5b4c3d2e1f012345678"
+FIELDS_MAPPING = {
+    PARTNER_HASH: {
+        "name": "Referral partner",
+        "normalized_name": "referral_partner",
+        "options": None,
+        "field_type": "org",
+    },
+    SOURCE_HASH: {
+        "name": "Source",
+        "normalized_name": "source",
+        "options": {"1": "Web", "2": "Event"},
+        "field_type": "enum",
+    },
+}
+
+
+def _page() -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": row_id,
+            "update_time": "2024-01-01 00:00:00",
+            "org_id": {"value": row_id, "name": "Acme"},
+            PARTNER_HASH: {"value": 10 + row_id, "name": "Partner"},
+            SOURCE_HASH: "1",
+        }
+        for row_id in (1, 2)
+    ]
+
+
+def _flattened_names(row: Dict[str, Any], prefix: str = "") -> List[str]:
+    names = []
+    for key, value in row.items():
+        if isinstance(value, dict):
+            names.extend(_flattened_names(value, prefix + key + "__"))
+        else:
+            names.append(prefix + key)
+    return names
+
+
+def test_object_custom_field_columns_match_dict_path() -> None:
+    naming = NamingConvention()
+    fields_mapping = compile_fields_mapping(FIELDS_MAPPING)
+    dict_rows = rename_fields(_page(), fields_mapping)
+    table = page_to_arrow(_page(), fields_mapping, "update_time")
+
+    dict_columns = {naming.normalize_path(name) for name in _flattened_names(dict_rows[0])}
+    arrow_columns = {naming.normalize_path(name) for name in table.column_names}
+    assert arrow_columns == dict_columns
+    assert "referral_partner__value" in arrow_columns
+    assert table.column("Source").to_pylist() == ["Web", "Web"]